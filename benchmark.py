@@ -0,0 +1,300 @@
+import argparse
+import gzip
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from requests.adapters import HTTPAdapter
+
+import cache
+import config
+import main
+import stats
+
+API_HOST : str = "https://www.nationstates.net"
+
+def _Hash(string : str) -> int:
+    return zlib.crc32(string.encode())
+
+def _RegionName(index : int) -> str:
+    return f"bench_region_{index}"
+
+def _DelegateName(region : str) -> str:
+    return region.replace("bench_region_", "bench_delegate_")
+
+def _Vote(delegate : str, chamber : str) -> str:
+    """The synthetic vote of a delegate, the same in every run."""
+    return ("FOR", "AGAINST", "UNDECIDED")[_Hash(delegate + chamber) % 3]
+
+class _MockServer(ThreadingHTTPServer):
+    """A stand-in for the NationStates API, serving synthetic regions, nations and resolutions after a fixed latency. If limit is
+    set, requests over limit per window seconds are refused with a 429, as the real API does. The dossier size (which sets the
+    delegates listed as voting on each resolution) is shared with the benchmark process."""
+    daemon_threads = True
+
+    def __init__(self, latency : float, limit : int, window : int, size):
+        super().__init__(("127.0.0.1", 0), _MockHandler)
+        self.latency = latency
+        self.limit = limit
+        self.window = window
+        self.size = size
+        self.request_times = []
+        self.lock = threading.Lock()
+
+def _ServeMock(latency : float, limit : int, window : int, size, ports : multiprocessing.Queue) -> None:
+    server = _MockServer(latency, limit, window, size)
+    ports.put(server.server_address[1])
+    server.serve_forever()
+
+def StartMockServer(latency : float, limit : int, window : int=30) -> tuple[multiprocessing.Process, str, object]:
+    """Starts the mock API in its own process, so that it does not compete with the commands being measured for the GIL.
+    Returns the process, its url, and the shared dossier size to set before each run."""
+    size = multiprocessing.Value("i", 0)
+    ports = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_ServeMock, args=(latency, limit, window, size, ports), daemon=True)
+    process.start()
+
+    return process, f"http://127.0.0.1:{ports.get(timeout=30)}", size
+
+class _MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def _Respond(self, status : int, body : str, headers : dict) -> None:
+        data = body.encode()
+
+        # like the real API, the body is compressed if the client asks for it
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            data = gzip.compress(data)
+            headers = headers | {"Content-Encoding" : "gzip"}
+
+        self.send_response(status)
+        self.send_header("Content-Type", "text/xml; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+
+        for header, value in headers.items():
+            self.send_header(header, str(value))
+
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _RegionBody(self, region : str, shards : list) -> str:
+        delegate = "0" if _Hash(region) % 20 == 0 else _DelegateName(region)
+        values = {"delegate" : ("DELEGATE", delegate),
+                  "delegatevotes" : ("DELEGATEVOTES", _Hash(region) % 200 + 1),
+                  "numwanations" : ("NUMUNNATIONS", _Hash(region) % 100 + 1)}
+
+        return f'<REGION id="{region}">' + "".join(f"<{tag}>{value}</{tag}>" for tag, value in (values[shard] for shard in shards if shard in values)) + "</REGION>"
+
+    def _NationBody(self, nation : str, shards : list) -> str:
+        values = {"gavote" : ("GAVOTE", _Vote(nation, "ga")), "scvote" : ("SCVOTE", _Vote(nation, "sc"))}
+
+        return f'<NATION id="{nation}">' + "".join(f"<{tag}>{value}</{tag}>" for tag, value in (values[shard] for shard in shards if shard in values)) + "</NATION>"
+
+    def _WorldAssemblyBody(self, council : str, shards : list) -> str:
+        chamber = "ga" if council == "1" else "sc"
+        delegate_votes = ""
+
+        if "delvotes" in shards:
+            for vote in ("FOR", "AGAINST"):
+                regions = [_RegionName(index) for index in range(self.server.size.value)]
+                delegates = [_DelegateName(region) for region in regions if _Hash(region) % 20 != 0 and _Vote(_DelegateName(region), chamber) == vote]
+                delegate_votes += f"<DELVOTES_{vote}>" + "".join(f"<DELEGATE><NATION>{delegate}</NATION><VOTES>{_Hash(delegate) % 200 + 1}</VOTES><TIMESTAMP>0</TIMESTAMP></DELEGATE>" for delegate in delegates) + f"</DELVOTES_{vote}>"
+
+        return (f'<WA council="{council}"><RESOLUTION><CATEGORY>Benchmark</CATEGORY><ID>bench_{chamber}</ID><NAME>Benchmark {chamber.upper()} Resolution</NAME>'
+                f"<PROPOSED_BY>bench_author</PROPOSED_BY><DESC>A synthetic resolution &amp; its text.</DESC>{delegate_votes}</RESOLUTION></WA>")
+
+    def do_GET(self) -> None:
+        with self.server.lock:
+            now = time.monotonic()
+            self.server.request_times = [request_time for request_time in self.server.request_times if now - request_time < self.server.window]
+            self.server.request_times.append(now)
+            seen = len(self.server.request_times)
+
+        time.sleep(self.server.latency)
+
+        headers = {"X-ratelimit-requests-seen" : seen if self.server.limit else 1}
+
+        if self.server.limit:
+            headers |= {"RateLimit-Policy" : f"{self.server.limit};w={self.server.window}", "RateLimit-Limit" : self.server.limit, "RateLimit-Remaining" : max(0, self.server.limit - seen), "RateLimit-Reset" : self.server.window}
+
+            if seen > self.server.limit:
+                self._Respond(429, "<h1>Too Many Requests</h1>", headers | {"Retry-After" : self.server.window, "X-Retry-After" : self.server.window})
+                return
+
+        query = parse_qs(urlparse(self.path).query)
+        shards = query.get("q", [""])[0].split()
+
+        if "region" in query:
+            body = self._RegionBody(query["region"][0], shards)
+        elif "nation" in query:
+            body = self._NationBody(query["nation"][0], shards)
+        elif "wa" in query:
+            body = self._WorldAssemblyBody(query["wa"][0], shards)
+        else:
+            self._Respond(400, "<h1>Bad Request</h1>", headers)
+            return
+
+        self._Respond(200, body, headers)
+
+class _RedirectAdapter(HTTPAdapter):
+    """Sends requests for the NationStates API to the mock server instead, over a connection pool like the client's own."""
+
+    def __init__(self, mock_url : str):
+        super().__init__(pool_maxsize=main.PoolSize())
+        self.mock_url = mock_url
+
+    def send(self, request, *args, **kwargs):
+        request.url = request.url.replace(API_HOST, self.mock_url, 1)
+        return super().send(request, *args, **kwargs)
+
+def _Percentile(values : list, percentile : float) -> float:
+    """The nearest-rank percentile of a sorted list."""
+    if values == []:
+        return 0.0
+
+    return values[min(len(values) - 1, max(0, round(percentile / 100 * len(values)) - 1))]
+
+def _Commands(regions : list) -> list[str]:
+    """The commands run for each dossier size, in the order a bloc would run them on a vote day."""
+    votes = {"for" : regions[0::3], "against" : regions[1::3], "abstain" : regions[2::6]}
+    vote_flags = " ".join(f"--{vote} [{", ".join(vote_regions)}]" for vote, vote_regions in votes.items() if vote_regions)
+
+    return ["power_refresh --export",
+            "compliance --ga --sc",
+            "compliance --fast --ga --sc",
+            f"calc_vote {vote_flags}",
+            f"make_dispatch --type [ga, sc] {vote_flags}"]
+
+def _RequestLatencies(trace_file : str, start : int) -> tuple[list[float], int]:
+    """Reads the request latencies traced since start (an offset in the trace file), and returns them sorted along with the new offset."""
+    with open(trace_file, "r") as trace:
+        trace.seek(start)
+        events = [json.loads(line) for line in trace]
+        end = trace.tell()
+
+    return sorted(event["seconds"] for event in events if event["type"] == "request"), end
+
+def RunSize(client, server_size, size : int, trace_file : str) -> list[dict]:
+    """Runs every benchmarked command against a synthetic dossier of size regions, with an empty cache."""
+    regions = [_RegionName(index) for index in range(size)]
+    server_size.value = size
+
+    with open(config.region_file, "w") as region_file:
+        region_file.write(",".join(regions))
+
+    cache.Invalidate()
+    trace_offset = os.path.getsize(trace_file)
+    results = []
+
+    for command in _Commands(regions):
+        tracemalloc.reset_peak()
+        start_memory = tracemalloc.get_traced_memory()[0]
+
+        try:
+            succeeded, output = main.RunCommand(lambda: client, command)
+        except Exception as error:
+            # a command stopped by an API error (such as being refused over the rate limit) is a failed result, not the end of the run
+            succeeded, output = False, f"{type(error).__name__}: {error}"
+
+        # both are 0 if memory is not being traced
+        peak_memory = tracemalloc.get_traced_memory()[1] - start_memory
+        record = stats.records[-1]
+        latencies, trace_offset = _RequestLatencies(trace_file, trace_offset)
+        name = command.split(" --for")[0]
+
+        results.append({"size" : size, "command" : name, "succeeded" : succeeded, "error" : None if succeeded else output,
+                        "wall" : record["wall"], "requests" : record["requests"], "kilobytes" : record["bytes"] / 1024,
+                        "regions_per_second" : size / record["wall"] if record["wall"] else 0.0,
+                        "requests_per_second" : record["requests"] / record["wall"] if record["wall"] else 0.0,
+                        "latency_ms" : {f"p{percentile}" : _Percentile(latencies, percentile) * 1000 for percentile in (50, 95, 99)} | {"max" : latencies[-1] * 1000 if latencies else 0.0},
+                        "throttled" : record["throttled"], "io" : record["io"], "peak_memory_kb" : peak_memory / 1024})
+
+    return results
+
+def _FormatResults(results : list[dict], previous : dict | None=None) -> str:
+    row_format = "{:>7} {:30.30}{:>10}{:>10}{:>11}{:>10}{:>10}{:>12}{:>10}\n"
+    string_out = row_format.format("regions", "command", "wall (s)", "requests", "regions/s", "p50 (ms)", "p95 (ms)", "peak (KB)", "vs prev")
+
+    for result in results:
+        previous_result = (previous or {}).get((result["size"], result["command"]))
+        change = f"{result["wall"] / previous_result["wall"]:.2f}x" if previous_result and previous_result["wall"] else ""
+
+        string_out += row_format.format(result["size"], result["command"] if result["succeeded"] else f"{result["command"]} (failed)", f"{result["wall"]:.3f}", result["requests"],
+                                        f"{result["regions_per_second"]:.0f}", f"{result["latency_ms"]["p50"]:.1f}", f"{result["latency_ms"]["p95"]:.1f}", f"{result["peak_memory_kb"]:.0f}", change)
+
+    return string_out
+
+def _ParseCommandLine() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the commands against a local stand-in for the NationStates API.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000], help="the dossier sizes to benchmark")
+    parser.add_argument("--latency", type=float, default=5, help="the latency (in milliseconds) of each mock API request")
+    parser.add_argument("--server-limit", type=int, default=0, help="refuse requests over this many per 30 seconds with a 429, like the real API (0 for no limit)")
+    parser.add_argument("--client-limit", type=int, default=0, help="the client rate limit (requests per ratelimit_window) to use instead of config.py's (0 for no limit)")
+    parser.add_argument("--no-memory", action="store_true", help="do not measure peak memory (which slows the commands down) to get purer timings")
+    parser.add_argument("--output", default=f"benchmark_{time.strftime("%Y%m%d%H%M%S", time.gmtime())}.json", help="the file to save the results to")
+    parser.add_argument("--compare", help="a previous results file to compare the wall times against")
+
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    command_line = _ParseCommandLine()
+    started = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+    output_path = os.path.abspath(command_line.output)
+    previous = None
+
+    if command_line.compare is not None:
+        with open(command_line.compare, "r") as previous_file:
+            previous = {(result["size"], result["command"]) : result for result in json.load(previous_file)["results"]}
+
+    server, server_url, server_size = StartMockServer(command_line.latency / 1000, command_line.server_limit)
+
+    # run in a scratch directory, so the real dossier, powers, cache and dispatches are left alone
+    template_path = os.path.abspath(config.dispatch_templates["default"])
+    work_directory = tempfile.mkdtemp(prefix="wascript_benchmark_")
+    os.chdir(work_directory)
+    shutil.copy(template_path, "dispatch_template.txt")
+
+    with open(config.recommendations_file, "w") as recommendations_file:
+        recommendations_file.write("GA,FOR\nSC,AGAINST\n")
+
+    config.trace_file = os.path.join(work_directory, "trace.jsonl")
+    open(config.trace_file, "w").close()
+    config.ratelimit_requests = command_line.client_limit or sys.maxsize
+
+    client = main.GetUserClient("benchmark")
+    client.api.session.mount(API_HOST, _RedirectAdapter(server_url))
+
+    if not command_line.no_memory:
+        tracemalloc.start()
+    results = []
+
+    try:
+        for size in command_line.sizes:
+            size_results = RunSize(client, server_size, size, config.trace_file)
+            results += size_results
+            print(_FormatResults(size_results, previous))
+    finally:
+        tracemalloc.stop()
+        server.terminate()
+        os.chdir(os.path.dirname(output_path))
+        shutil.rmtree(work_directory, ignore_errors=True)
+
+    with open(output_path, "w") as output_file:
+        json.dump({"started" : started, "python" : sys.version.split()[0], "latency_ms" : command_line.latency,
+                   "server_limit" : command_line.server_limit, "client_limit" : command_line.client_limit, "fetch_workers" : config.fetch_workers,
+                   "results" : results}, output_file, indent=4)
+
+    print(f"Saved the results to {output_path}")
@@ -0,0 +1,68 @@
+import json
+import sqlite3
+import threading
+import time
+
+import config
+
+_connection : sqlite3.Connection | None = None
+_lock       : threading.Lock            = threading.Lock()
+
+# when set (to the time the command began), every lookup of a response fetched before then misses, so that fresh data is fetched
+# (and then stored). Responses fetched since are used, so the same command does not fetch them twice
+fresh_since : float | None = None
+
+hits   : dict[str, int] = {}
+misses : dict[str, int] = {}
+
+def _Connect() -> sqlite3.Connection:
+    global _connection
+
+    if _connection is None:
+        _connection = sqlite3.connect(config.cache_file, check_same_thread=False)
+        _connection.execute("PRAGMA journal_mode=WAL")
+        _connection.execute("PRAGMA synchronous=NORMAL")
+        _connection.execute("CREATE TABLE IF NOT EXISTS responses (kind TEXT, key TEXT, value TEXT, fetched REAL, PRIMARY KEY (kind, key))")
+        _connection.execute("CREATE INDEX IF NOT EXISTS responses_fetched ON responses (fetched)")
+
+    return _connection
+
+def Get(kind : str, key : str):
+    """Returns the cached value of kind for key, or None if it is missing, older than the TTL for kind, or fetched before fresh data
+    was asked for."""
+    with _lock:
+        row = _Connect().execute("SELECT value, fetched FROM responses WHERE kind = ? AND key = ?", (kind, key)).fetchone()
+
+        if row is None or time.time() - row[1] > config.cache_ttls[kind] or (fresh_since is not None and row[1] < fresh_since):
+            misses[kind] = misses.get(kind, 0) + 1
+            return None
+
+        hits[kind] = hits.get(kind, 0) + 1
+        return json.loads(row[0])
+
+def Put(kind : str, key : str, value) -> None:
+    """Stores value for key, evicting the oldest entries if the cache holds more than config.cache_max_entries."""
+    with _lock:
+        connection = _Connect()
+        connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)", (kind, key, json.dumps(value), time.time()))
+        connection.execute("DELETE FROM responses WHERE rowid IN (SELECT rowid FROM responses ORDER BY fetched LIMIT max(0, (SELECT COUNT(*) FROM responses) - ?))", (config.cache_max_entries,))
+        connection.commit()
+
+def Invalidate(kind : str | None=None, key : str | None=None) -> int:
+    """Removes the cached entries matching kind and key (everything, if neither is given). Returns the number removed."""
+    with _lock:
+        connection = _Connect()
+
+        if kind is None:
+            removed = connection.execute("DELETE FROM responses").rowcount
+        elif key is None:
+            removed = connection.execute("DELETE FROM responses WHERE kind = ?", (kind,)).rowcount
+        else:
+            removed = connection.execute("DELETE FROM responses WHERE kind = ? AND key = ?", (kind, key)).rowcount
+
+        connection.commit()
+        return removed
+
+def EntryCount() -> int:
+    with _lock:
+        return _Connect().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
@@ -1,35 +1,33 @@
-import csv
+from __future__ import annotations
+
+import contextlib
 import time
 import os 
+from typing import TYPE_CHECKING
 
-import nationstates
-
+import cache
 import config
-
-def _ReadFile(filepath : str, flat_list : bool=True) -> list:
-    with open(filepath, "r") as file:
-        file_reader = csv.reader(file, delimiter=",")
-
-        starting_list = [row for row in file_reader]
-        output = []
-
-        if not flat_list:
-            return starting_list
-        
-        for row in starting_list:
-            output.extend(row) 
-
-        return output
+import dump
+import fetch
+import history
+import report
+import state
+import stats
+import swing
+import template
+
+# the API client is only loaded for commands which use it (see config.offline_commands)
+if TYPE_CHECKING:
+    import nationstates
 
 def _MatchFlagsArgs(flags : list, arguments : list, do_duplication : bool=False) -> dict:
     if len(arguments) == 0 and not all(flag in config.nonargument_flags for flag in flags):
         return (-1, "No arguments were provided")
     
     output = {}
-    for idx, flag in enumerate(flags):
-        if flag in config.nonargument_flags:
-            continue
+    argument_flags = [flag for flag in flags if flag not in config.nonargument_flags]
 
+    for idx, flag in enumerate(argument_flags):
         try:
             output[flag] = arguments[idx]
         except IndexError:
@@ -68,133 +66,353 @@ def _DoInputLoop(regions_list : list,) -> tuple:
     return for_power, against_power, abstain_power, nonvote_power, flags_args, nonvoters
 
 
+def _GetDelegateMap(client : nationstates.Nationstates, regions : list, remap : bool=False) -> tuple[dict, dict]:
+    """Returns the region -> delegate map for the given regions, served from the cache where possible (fetching every delegate again
+    if remapping), along with the errors for any regions that could not be fetched."""
+    regions = list(dict.fromkeys(regions))
+    delegate_map, errors = {}, {}
+
+    if remap:
+        for region in regions:
+            cache.Invalidate("delegate", region)
+
+    for region, result, error in fetch.FetchAll(client, fetch.FetchDelegate, regions):
+        if error is not None:
+            errors[region] = error
+            continue
+
+        delegate_map[region] = result["delegate"]
+
+    return delegate_map, errors
+
+def _IsCompliant(vote : str, recommendation : str | None) -> bool:
+    return (vote == recommendation) or (recommendation is None)
+
 def _CalcVotePercent(side_power : int, total_power : int) -> float:
     return round(((side_power/total_power) * 100), 2)
 
-def CheckCompliance(client : nationstates.Nationstates, flags : list, *args) -> str | int:
+def _CurrentResolutionId(client : nationstates.Nationstates, chamber : int) -> str | None:
+    """The id of the resolution at vote in a chamber, or None if there is none."""
+    try:
+        return fetch.ResolutionId(fetch.FetchResolution(client, chamber))
+    except LookupError:
+        return None
+
+def _Recommendation(for_percent : float, against_percent : float, abstain_percent : float) -> tuple[str, float]:
+    """Returns the recommendation the percentages give, and the percentage it was carried by (which binds it if over 50)."""
+    if for_percent > max(against_percent, abstain_percent):
+        return "FOR", for_percent
+    elif against_percent > abstain_percent:
+        return "AGAINST", against_percent
+
+    return "NO RECOMMENDATION", abstain_percent
+
+def _SwingAnalysis(powers : list[int], total_power : int, nonvoters : list[tuple[str, int]]) -> str:
+    """Finds, for each way the non-voting regions could vote, the fewest of them and the least power it would take to carry the
+    recommendation and to make it binding."""
+    string_out = f"Swing analysis ({len(nonvoters)} non-voting regions, {sum(power for _, power in nonvoters)} power):\n"
+
+    for side, (vote, outcome) in enumerate((("FOR", "FOR"), ("AGAINST", "AGAINST"), ("ABSTAIN", "NO RECOMMENDATION"))):
+
+        def _Outcome(extra : int) -> tuple[str, float]:
+            percents = [_CalcVotePercent(power + (extra if index == side else 0), total_power) for index, power in enumerate(powers)]
+            return _Recommendation(*percents)
+
+        goals = (("carry", lambda extra: _Outcome(extra)[0] == outcome), ("bind", lambda extra: _Outcome(extra)[0] == outcome and _Outcome(extra)[1] > 50))
+
+        for goal, succeeds in goals:
+            needed = swing.Threshold(succeeds, sum(power for _, power in nonvoters))
+            string_out += f"{vote} votes to {goal} {outcome}: "
+
+            if needed is None:
+                string_out += "not possible\n"
+                continue
+            elif needed == 0:
+                string_out += "already\n"
+                continue
+
+            fewest, least = swing.FewestRegions(nonvoters, needed), swing.LeastPower(nonvoters, needed)
+            string_out += f"{needed} more power needed\n"
+            string_out += f"    fewest regions ({len(fewest)}, {sum(power for _, power in fewest)} power): {', '.join(region for region, _ in fewest)}\n"
+            string_out += f"    least power ({sum(power for _, power in least)}, {len(least)} regions): {', '.join(region for region, _ in least)}\n"
+
+    return string_out
+
+def _FastResult(region : str, result : dict | None, error : str | None, chamber_votes : dict) -> tuple:
+    """Joins a region's delegate against the delegate votes of each chamber, into a result like fetch.FetchDelegateVotes'."""
+    if error is not None:
+        return (region, None, error)
+    elif result["delegate"] == "0":
+        return (region, None, "region has no delegate")
+
+    delegate = result["delegate"]
+    return (region, {"region" : region, "delegate" : delegate} | {vote_key : votes.get(delegate, "UNDECIDED") for vote_key, votes in chamber_votes.items()}, None)
+
+def CheckCompliance(client : nationstates.Nationstates, flags : list, *args):
     """Checks the compliance of the given regions in the versus the current recommendations. Flags:
-    \n--ga [regions] -> check the list of regions [regions] for ga compliance.\n--sc [regions] -> check the list of regions [regions] for sc compliance.\n--export -> export non-compliant regions to a file.
-    \nif both flags are provided but only one list is, the one list will be checked for both flags.\nIf no arguments are provided, the regions dossier will be checked.\n"""
+    \n--ga [regions] -> check the list of regions [regions] for ga compliance.\n--sc [regions] -> check the list of regions [regions] for sc compliance.\n--export -> write the report to a file instead, and every region's result to files in the formats set in config.py.\n--fast -> check using each chamber's list of delegate votes and the cached delegate of each region, instead of each delegate's own vote.\n--remap -> with --fast, fetch the delegate of every region again rather than using the cached delegates.\n--fresh -> ignore cached responses and fetch everything again.\n--bloc [names] -> run for each of the blocs [names] (from config.py) instead of the default bloc.
+    \nif both flags are provided but only one list is, the one list will be checked for both flags.\nIf no arguments are provided, the regions dossier will be checked.\nEach non-compliant region (and each which could not be checked) is shown as soon as it has been checked, followed by a count for each chamber.\n"""
     
     # if no specific arguments are provided, read the region file 
     if args == ([],):
-        args = [_ReadFile(config.region_file)]
+        args = [state.Dossier()]
     else:
         args = args[0]
 
     # match the order of args to flags
     flag_args = _MatchFlagsArgs(flags, args, True)
 
-    # check for flags, and collect the right output depending on which ones we have 
-    writing_ga, writing_sc = False, False
+    # the chambers being checked, and the regions checked in each
+    chambers = [(flag, name, vote_key) for flag, name, vote_key in (("--ga", "GA", "gavote"), ("--sc", "SC", "scvote")) if flag in flags]
+    chamber_regions = {name : set(flag_args[flag]) for flag, name, _ in chambers}
 
-    if "--ga" in flags:
-        writing_ga = True
-        ga_region_objects = [client.region(region) for region in flag_args["--ga"]]
-        ga_delegates = [client.nation(region.delegate) for region in ga_region_objects]
+    # regions in both lists are only fetched once, as each result holds both votes
+    regions = list(dict.fromkeys(flag_args.get("--ga", []) + flag_args.get("--sc", [])))
 
+    if "--fast" in flags:
+        # fetch the delegate votes of each chamber (one request each) and join them against the cached delegate of each region
+        chamber_votes = {}
 
+        for flag, name, vote_key in chambers:
+            try:
+                chamber_votes[vote_key] = fetch.FetchChamberVotes(client, 1 if name == "GA" else 2)
+            except LookupError:
+                return (-1, f"No resolution is currently at vote in the {name}")
 
-    if "--sc" in flags:
-        writing_sc = True
-        sc_region_objects = [client.region(region) for region in flag_args["--sc"]]
-        sc_delegates = [client.nation(region.delegate) for region in sc_region_objects]
+        if "--remap" in flags:
+            for region in regions:
+                cache.Invalidate("delegate", region)
+
+        results = (_FastResult(region, result, error, chamber_votes) for region, result, error in fetch.FetchEach(client, fetch.FetchDelegate, regions))
+    else:
+        results = fetch.FetchEach(client, fetch.FetchDelegateVotes, regions)
 
     # extract the current recs in the format "GA" : "FOR", etc
-    current_recs  = {i[0] : i[1] for i in _ReadFile(config.recommendations_file, flat_list=False)} 
+    current_recs  = state.Recommendations()
 
-    # initialise temp variables 
-    noncompliant_ga, noncompliant_sc = [], []
+    counts = {name : {"non-compliant" : 0, "could not be checked" : 0, "compliant" : 0} for _, name, _ in chambers}
 
-    if writing_ga:
-        for idx, nation in enumerate(ga_delegates): 
-            compliance = True if ((nation.gavote == current_recs["GA"]) or (current_recs["GA"] is None)) else False
+    with contextlib.ExitStack() as exports:
+        # each region's result is archived as soon as it is checked
+        archive = {name : exports.enter_context(history.RecordCompliance(name, _CurrentResolutionId(client, 1 if name == "GA" else 2), current_recs[name])) for _, name, _ in chambers}
 
-            if not compliance:
-                noncompliant_ga.append([nation.nation_name, ga_region_objects[idx].region_name, nation.gavote])
+        # with --export, the report goes to a file rather than the console, and every result to the export files
+        report_file, write_row = None, lambda row: None
 
-    if writing_sc:
-        for idx, nation in enumerate(sc_delegates):
-            compliance = True if ((nation.scvote == current_recs["SC"]) or (current_recs["SC"] is None)) else False
+        if "--export" in flags:
+            report_file = exports.enter_context(open(state.OutputName("compliance_report.txt"), "w"))
+            write_row = exports.enter_context(report.Export(state.OutputName(time.strftime("%Y%m%d%H%M%S_compliance", time.gmtime())), ["chamber", "region", "delegate", "vote", "recommendation", "compliant", "error"], config.export_formats))
 
-            if not compliance:
-                noncompliant_sc.append([nation.nation_name, sc_region_objects[idx].region_name, nation.scvote])
+        header = f"Checking {len(regions)} regions against the recommendations ({', '.join(f'{name}: {current_recs[name]}' for _, name, _ in chambers)}). Non-compliant regions, and those which could not be checked:\n"
+        if report_file:
+            report_file.write(header)
+        else:
+            yield header
 
-    compliance_out = ""
-    
-    # create an output depending on which regions are not complying as calculated earlier
-    if writing_ga:
-        compliance_out += ("The following regions are non-compliant in the GA:\n")
+        for region, result, error in results:
+            lines = ""
 
-        for item in noncompliant_ga:
-            compliance_out += f"{item[1]}{' '*(30-len(item[1]))}-> (current delegate: {item[0]}, current vote: {item[2]})" + "\n"
+            for _, name, vote_key in chambers:
+                if region not in chamber_regions[name]:
+                    continue
 
-        if noncompliant_ga == []:
-            compliance_out += ("None\n")
+                if error is not None:
+                    counts[name]["could not be checked"] += 1
+                    archive[name](region, None, None, None)
+                    write_row((name, region, None, None, current_recs[name], None, error))
+                    lines += f"{region}{' '*(30-len(region))}-> {name} could not be checked ({error})\n"
+                    continue
 
-    if writing_sc:
-        compliance_out += ("The following regions are non-compliant in the SC:\n")
+                compliance = _IsCompliant(result[vote_key], current_recs[name])
+                counts[name]["compliant" if compliance else "non-compliant"] += 1
+                archive[name](region, result["delegate"], result[vote_key], compliance)
+                write_row((name, region, result["delegate"], result[vote_key], current_recs[name], compliance, None))
 
-        for item in noncompliant_sc:
-            compliance_out += f"{item[1]}{' '*(30-len(item[1]))}-> (current delegate: {item[0]}, current vote: {item[2]})" + "\n"
-        
-        if noncompliant_sc == []:
-            compliance_out += ("None\n")
-    
-    # if we did not include export flags, then just return the string for print-out
-    # otherwise, write all of the output to the file
-    if "--export" not in flags:
-        return compliance_out
-    
-    with open("compliance_report.txt", "w") as compliance_report:
-        compliance_report.write(compliance_out)
+                if not compliance:
+                    lines += f"{region}{' '*(30-len(region))}-> {name} non-compliant (current delegate: {result['delegate']}, current vote: {result[vote_key]})\n"
+
+            if lines == "":
+                continue
+            elif report_file:
+                report_file.write(lines)
+            else:
+                yield lines
+
+        summary = "".join(f"{name}: {', '.join(f'{count} {outcome}' for outcome, count in counts[name].items())}\n" for _, name, _ in chambers)
+        if report_file:
+            report_file.write(summary)
+        else:
+            yield summary
 
     return 0
 
-def ModifyDossier(client : nationstates.Nationstates, flags : list, *args):
-    """Update the region dossier file as specified in the configuration file. flags:\n\n--add [regions] -> adds regions [regions] to the dossier.\n--del [regions] -> deletes regions [regions] from the dossier.\n"""
-    current_dossier = _ReadFile(config.region_file)
+def _WatchRound(client : nationstates.Nationstates, regions : list, chambers : list, delegate_map : dict, errors : dict, recheck : list) -> dict:
+    """Runs one round of a compliance watch: fetches the delegates of the regions to recheck (updating the delegate map and errors),
+    then the delegate votes of each chamber. Returns each region's delegate, votes and compliance, or its error."""
+    if recheck != []:
+        for region in recheck:
+            cache.Invalidate("delegate", region)
 
-    flags_args = _MatchFlagsArgs(flags, args[0])
+        for region, result, error in fetch.FetchAll(client, fetch.FetchDelegate, recheck):
+            if error is not None:
+                errors[region] = error
+                continue
 
-    if type(flags_args) == tuple:
+            errors.pop(region, None)
+            delegate_map[region] = result["delegate"]
+
+    chamber_votes = {}
+
+    for chamber, number in (("GA", 1), ("SC", 2)):
+        if chamber not in chambers:
+            continue
+
+        cache.Invalidate("chamber_votes", str(number))
+
+        try:
+            chamber_votes[chamber] = fetch.FetchChamberVotes(client, number)
+        except LookupError:
+            chamber_votes[chamber] = None
+
+    current_recs = state.Recommendations()
+    round_state = {}
+
+    for region in regions:
+        if region in errors:
+            round_state[region] = {"error" : errors[region]}
+            continue
+
+        if delegate_map[region] == "0":
+            round_state[region] = {"error" : "region has no delegate"}
+            continue
+
+        delegate = delegate_map[region]
+        round_state[region] = {"delegate" : delegate, "votes" : {}, "compliant" : {}}
+
+        for chamber, votes in chamber_votes.items():
+            if votes is None:
+                continue
+
+            vote = votes.get(delegate, "UNDECIDED")
+            round_state[region]["votes"][chamber] = vote
+            round_state[region]["compliant"][chamber] = _IsCompliant(vote, current_recs[chamber])
+
+    return round_state
+
+def _WatchChanges(previous : dict | None, current : dict) -> tuple[list[str], set]:
+    """Compares two rounds of a compliance watch, returning the changes to report and the regions which changed."""
+    changes, changed_regions = [], set()
+
+    for region, now in current.items():
+        before = (previous or {}).get(region, {})
+
+        if "error" in now:
+            if now["error"] != before.get("error"):
+                changes.append(f"{region}{' '*(30-len(region))}-> could not be checked ({now['error']})")
+            continue
+
+        if "delegate" in before and before["delegate"] != now["delegate"]:
+            changes.append(f"{region}{' '*(30-len(region))}-> delegate changed from {before['delegate']} to {now['delegate']}")
+            changed_regions.add(region)
+
+        for chamber, compliant in now["compliant"].items():
+            vote = now["votes"][chamber]
+            was_compliant = before.get("compliant", {}).get(chamber, True)
+
+            if was_compliant and not compliant:
+                changes.append(f"{region}{' '*(30-len(region))}-> now non-compliant in the {chamber} (current delegate: {now['delegate']}, current vote: {vote})")
+            elif compliant and not was_compliant:
+                changes.append(f"{region}{' '*(30-len(region))}-> now compliant in the {chamber} (current delegate: {now['delegate']}, current vote: {vote})")
+            elif chamber in before.get("votes", {}) and before["votes"][chamber] != vote:
+                changes.append(f"{region}{' '*(30-len(region))}-> vote in the {chamber} changed from {before['votes'][chamber]} to {vote}")
+            else:
+                continue
+
+            changed_regions.add(region)
+
+    return changes, changed_regions
+
+def WatchCompliance(client : nationstates.Nationstates, flags : list, *args):
+    """Repeatedly check compliance during a vote, only reporting what has changed since the last check. Flags:\n\n--regions [regions] -> watch the regions [regions] instead of the dossier.\n--chambers [chambers] -> watch the given chambers (ga and/or sc) rather than both.\n--interval [seconds] -> wait [seconds] between checks (default set in config.py).\n--rounds [rounds] -> stop after [rounds] checks, rather than when interrupted with Ctrl+C.\n\nEach check costs one request per chamber, plus re-checking the delegates of a fixed number of regions (set in config.py), favouring regions which recently changed or are non-compliant. Changes are also appended to the watch log file."""
+    flags_args = _MatchFlagsArgs(flags, args[0]) if args[0] else {}
+
+    if isinstance(flags_args, tuple):
         return flags_args
-    
+
+    regions = flags_args.get("--regions") or state.Dossier()
+    chambers = [chamber.upper() for chamber in flags_args.get("--chambers") or ["ga", "sc"]]
+
+    if any(chamber not in ("GA", "SC") for chamber in chambers):
+        return (-1, "Chambers can only be 'ga' and 'sc'")
+
     try:
-        for region in flags_args["--add"]:
-            current_dossier.append(region)
-    except KeyError:
-        pass
+        interval = float(flags_args["--interval"][0]) if flags_args.get("--interval") else config.watch_interval
+        rounds = int(flags_args["--rounds"][0]) if flags_args.get("--rounds") else None
+    except ValueError:
+        return (-1, "Invalid interval or number of rounds provided")
+
+    delegate_map, errors = _GetDelegateMap(client, regions)
+
+    # the round in which each region's delegate was last checked, and the regions to check first in the next round
+    last_checked = {region : 0 for region in regions}
+    priority = set()
+
+    previous = None
+    round_number, changes_reported = 0, 0
 
     try:
-        for region in flags_args["--del"]:
-            current_dossier.remove(region)
-    except (KeyError, ValueError):
+        while rounds is None or round_number < rounds:
+            round_number += 1
+
+            recheck = []
+
+            if round_number > 1:
+                recheck = sorted(regions, key=lambda region: (region not in priority, last_checked[region]))[:config.watch_delegate_checks]
+
+                for region in recheck:
+                    last_checked[region] = round_number
+
+            current = _WatchRound(client, regions, chambers, delegate_map, errors, recheck)
+            changes, changed_regions = _WatchChanges(previous, current)
+
+            if changes != []:
+                timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+                changes = [f"[{timestamp}] {change}" for change in changes]
+                print("\n".join(changes))
+
+                with open(config.watch_log_file, "a") as watch_log:
+                    watch_log.write("\n".join(changes) + "\n")
+
+            changes_reported += len(changes)
+            priority = changed_regions | {region for region, now in current.items() if not all(now.get("compliant", {}).values())}
+            previous = current
+
+            if rounds is None or round_number < rounds:
+                time.sleep(interval)
+    except KeyboardInterrupt:
         pass
 
-    with open(config.region_file, "w") as region_dossier:
-        for idx, region in enumerate(current_dossier):
-            if idx != len(current_dossier) -1 :
-                region_dossier.write(f"{region},")
-                continue
+    return f"Watch stopped after {round_number} checks, with {changes_reported} changes reported (logged to {config.watch_log_file})"
 
-            region_dossier.write(region)
+def ModifyDossier(client : nationstates.Nationstates, flags : list, *args):
+    """Update the region dossier file as specified in the configuration file. flags:\n\n--add [regions] -> adds regions [regions] to the dossier.\n--del [regions] -> deletes regions [regions] from the dossier.\n--bloc [names] -> run for each of the blocs [names] (from config.py) instead of the default bloc.\n"""
+    flags_args = _MatchFlagsArgs(flags, args[0])
 
-    return 0
-            
-def ListRegions(client : nationstates.Nationstates, flags : list, *args):
-    "List all regions in the regions dossier.\n"
-    regions = _ReadFile(config.region_file)
-    print("Current regions in dossier:")
+    if type(flags_args) == tuple:
+        return flags_args
 
-    for region in regions:
-        print(region)
+    state.AddToDossier(flags_args.get("--add", []))
+    state.RemoveFromDossier(flags_args.get("--del", []))
 
     return 0
+            
+def ListRegions(client : nationstates.Nationstates, flags : list, *args):
+    "List all regions in the regions dossier. Flags:\n\n--bloc [names] -> run for each of the blocs [names] (from config.py) instead of the default bloc.\n"
+    return "Current regions in dossier:\n" + "\n".join(state.Dossier())
 
 def UpdateRecs(client : nationstates.Nationstates, flags : list, *args):
-    """Update recommendations and write them to the recommendations.csv file. Flags:\n\n--ga [rec] -> update the current SC recommendation.\n--sc [rec] -> update the current SC recommendation."""
-    current_recs  = {i[0] : i[1] for i in _ReadFile(config.recommendations_file, flat_list=False)} 
+    """Update recommendations and write them to the recommendations.csv file. Flags:\n\n--ga [rec] -> update the current SC recommendation.\n--sc [rec] -> update the current SC recommendation.\n--bloc [names] -> run for each of the blocs [names] (from config.py) instead of the default bloc."""
+    current_recs  = dict(state.Recommendations())
     flags_args = _MatchFlagsArgs(flags, args[0])
 
     if any(len(value) > 1 for value in flags_args.values()):
@@ -206,200 +424,463 @@ def UpdateRecs(client : nationstates.Nationstates, flags : list, *args):
     if "--sc" in flags:
         current_recs["SC"] = flags_args["--sc"][0].upper()
 
-    with open(config.recommendations_file, "w") as recommendations:
-        recommendations.write(f"GA,{current_recs["GA"]}\n")
-        recommendations.write(f"SC,{current_recs['SC']}")
+    state.SetRecommendations(current_recs)
     
     return 0
 
 
 def RefreshPower(client : nationstates.Nationstates, flags : list, *args):
-    """Regenerate the voting powers of all regions specified. Flags:\n\n--regions [regions] -> update power for specified regions.\n--export -> export the power ratings into a file.\n\nIf no regions are specified, the regions dossier will be used."""
+    """Regenerate the voting powers of all regions specified. Flags:\n\n--regions [regions] -> update power for specified regions.\n--export -> export the power ratings into a file.\n--fresh -> ignore cached responses and fetch everything again.\n--dump -> read the powers from the daily regions and nations dumps (as set in config.py) instead of the API.\n--stale [hours] -> only refresh regions missing from the power file or last refreshed more than [hours] ago (default set in config.py), and update the power file in place.\n--bloc [names] -> run for each of the blocs [names] (from config.py) instead of the default bloc.\n\nIf no regions are specified, the regions dossier will be used. Each region is shown as soon as its power has been fetched."""
     
-    if args == ([],):
-        args = [_ReadFile(config.region_file)]
-    else:
-        args = args[0]
+    flags_args = _MatchFlagsArgs(flags, args[0]) if args[0] else {}
 
-    if (flags == []) or (flags == ["--export"]):
-        flags_args = {"--regions" : args[0]}
-    else:
-        flags_args = _MatchFlagsArgs(flags, args)
+    if isinstance(flags_args, tuple):
+        return flags_args
+
+    if "--regions" not in flags_args:
+        flags_args["--regions"] = state.Dossier()
 
     raw_output = []
     string_out = ""
 
     total_delegate_votes, total_wa_nations, total_power = 0,0,0
 
-    for region in flags_args["--regions"]:
-        current_region = client.region(region)
-        delegate_votes = int(current_region.delegatevotes)
-        numwanations   = int(current_region.get_shards("numwanations")["numunnations"])
+    failed_regions = []
+    refresh_time = int(time.time())
+
+    # when only refreshing stale regions, start from the current power file and fetch just the regions which are old or missing
+    current_rows = {}
+    to_refresh = flags_args["--regions"]
+
+    if "--stale" in flags:
+        try:
+            max_age = float(flags_args["--stale"][0]) * 60 * 60 if flags_args.get("--stale") else config.power_max_age
+        except ValueError:
+            return (-1, f"Invalid age provided: '{flags_args['--stale'][0]}'")
+
+        current_rows = dict(state.PowerRows())
+
+        # regions removed from the dossier are removed from the power file too
+        if "--regions" not in flags:
+            dossier = set(flags_args["--regions"])
+            current_rows = {region : row for region, row in current_rows.items() if region in dossier}
+
+        to_refresh = [region for region in flags_args["--regions"] if (region not in current_rows) or (len(current_rows[region]) < 5) or (refresh_time - int(current_rows[region][4]) > max_age)]
+
+    if "--dump" in flags:
+        try:
+            power_results = dump.ReadRegionPower(config.regions_dump_file, config.nations_dump_file, to_refresh)
+        except FileNotFoundError as error:
+            return (-1, f"Could not find the dump file '{error.filename}'")
+    else:
+        power_results = fetch.FetchEach(client, fetch.FetchRegionPower, to_refresh)
+
+    for region, result, error in power_results:
+        if error is not None:
+            failed_regions.append([region, error])
+            continue
+
+        delegate_votes = result["delegatevotes"]
+        numwanations   = result["numwanations"]
         total_regional_power    = delegate_votes + numwanations
 
-        total_delegate_votes += delegate_votes
-        total_wa_nations += numwanations
-        total_power += total_regional_power
-        raw_output.append([region, delegate_votes, numwanations, total_regional_power])
+        raw_output.append([region, delegate_votes, numwanations, total_regional_power, refresh_time])
 
-    raw_output.append(["TOTAL", total_delegate_votes, total_wa_nations, total_power])
+        # each region is shown as soon as its power is known
+        yield "{:25}{:6}{:6}{:6}\n".format(region, delegate_votes, numwanations, total_regional_power)
 
-    for row in raw_output:
-        string_out += "{:25}{:6}{:6}{:6}\n".format(row[0], row[1], row[2], row[3])
+    if "--stale" in flags:
+        current_rows.update((row[0], row) for row in raw_output)
+        power_rows = list(current_rows.values())
+    else:
+        # a region which could not be refreshed keeps its row from the power file, so one failed request does not drop it
+        current_rows = state.PowerRows()
+        refreshed_rows = {row[0] : row for row in raw_output}
+        power_rows = [refreshed_rows.get(region) or current_rows[region] for region in dict.fromkeys(to_refresh) if (region in refreshed_rows) or (region in current_rows)]
 
-    if "--export" in flags:
-        with open(config.votepower_file, "w", newline="") as votepower_file:
-            writer = csv.writer(votepower_file,delimiter=",")
-            writer.writerows(raw_output)
+    for row in power_rows:
+        total_delegate_votes += int(row[1])
+        total_wa_nations += int(row[2])
+        total_power += int(row[3])
 
-    return string_out
+    total_row = ["TOTAL", total_delegate_votes, total_wa_nations, total_power, refresh_time]
+
+    string_out += "{:25}{:6}{:6}{:6}\n".format(total_row[0], total_row[1], total_row[2], total_row[3])
+
+    if "--stale" in flags:
+        string_out += f"\nRefreshed {len(raw_output)} of {len(power_rows)} regions\n"
+
+    if failed_regions != []:
+        string_out += "\nThe following regions could not be refreshed:\n"
+
+        for item in failed_regions:
+            kept = ", kept its previous power" if item[0] in current_rows else ""
+            string_out += f"{item[0]}{' '*(30-len(item[0]))}-> ({item[1]}{kept})" + "\n"
+
+    if ("--export" in flags) or ("--stale" in flags):
+        state.WritePower(power_rows, total_row)
+
+    yield string_out
+    return 0
 
-def CalculateVotes(client : nationstates.Nationstates, flags : list, nums_only=False, *args):
-    """Calculate vote percentage and recommendation based on given inputs. Flags:\n\n--for [regions] -> the regions which voted 'FOR'.\n--against [regions] -> the regions which voted 'AGAINST'.\n--abstain [regions] -> the regions which voted to 'ABSTAIN'.\n--input -> be prompted to input each nation INSTEAD OF PROVIDING VALUES TO OTHER FLAGS FOR THE VOTES\n\nAny region in the dossier but not provided in arguments will be marked as a non-vote."""
+def CalculateVotes(client : nationstates.Nationstates, flags : list, *args, nums_only=False):
+    """Calculate vote percentage and recommendation based on given inputs. Flags:\n\n--for [regions] -> the regions which voted 'FOR'.\n--against [regions] -> the regions which voted 'AGAINST'.\n--abstain [regions] -> the regions which voted to 'ABSTAIN'.\n--input -> be prompted to input each nation INSTEAD OF PROVIDING VALUES TO OTHER FLAGS FOR THE VOTES\n--resolution [name] -> the resolution voted on, which the tally is archived under (tallies without it are not archived).\n--export -> also write the tally to a report file, and each region's vote to files in the formats set in config.py.\n--swing -> also show the fewest non-voting regions, and the least of their power, which could carry or bind each recommendation. The tally is not archived.\n--bloc [names] -> run for each of the blocs [names] (from config.py) instead of the default bloc.\n\nAny region in the dossier but not provided in arguments will be marked as a non-vote. Tallies given a --resolution are archived (see history)."""
     flags_args = _MatchFlagsArgs(flags, args[0] if args else [])
     if isinstance(flags_args, tuple):
         return flags_args
+
+    # only tallies of a named resolution are archived, as officers tally a vote several times while it goes on
+    resolutions = flags_args.get("--resolution") or []
     
-    regions_power = _ReadFile(config.votepower_file, False)
-    total_power = int(regions_power[-1][3])
+    regions_power = list(state.PowerRows().values())
+    total_power = state.PowerTotal()[3]
+
+    if total_power == 0:
+        return (-1, "No voting powers have been exported yet (use power_refresh --export)")
 
     for_power, against_power, abstain_power, nonvote_power = 0, 0, 0, 0
     nonvoters = []
     if "--input" in flags:
-        for_power, against_power, abstain_power, nonvote_power, flags_args, nonvoters = _DoInputLoop(regions_power[:-1],)
+        for_power, against_power, abstain_power, nonvote_power, flags_args, nonvoters = _DoInputLoop(regions_power,)
     else:
         for flag in ("--for", "--against", "--abstain"):
             if flag not in flags:
                 flags_args[flag] = []
 
-        for region in regions_power[:-1]:
-            if region[0] in flags_args["--for"]:
-                for_power += int(region[3])
-            elif region[0] in flags_args["--against"]:
-                against_power += int(region[3])
-            elif region[0] in flags_args["--abstain"]:
-                abstain_power += int(region[3])
+        for_regions, against_regions, abstain_regions = set(flags_args["--for"]), set(flags_args["--against"]), set(flags_args["--abstain"])
+
+        for region in regions_power:
+            if region[0] in for_regions:
+                for_power += region[3]
+            elif region[0] in against_regions:
+                against_power += region[3]
+            elif region[0] in abstain_regions:
+                abstain_power += region[3]
             else:
-                nonvote_power += int(region[3])
+                nonvote_power += region[3]
                 nonvoters.append(region[0])
 
     for_percent, against_percent, abstain_percent, nonvote_percent = (_CalcVotePercent(power, total_power) for power in (for_power, against_power, abstain_power, nonvote_power))
-    max_percent, recommendation = None, None, 
+    recommendation, max_percent = _Recommendation(for_percent, against_percent, abstain_percent)
     mandatory = "NON-BINDING"
 
-    string_out = ""
-
-    if for_percent > max(against_percent, abstain_percent):
-        max_percent, recommendation = for_percent, "FOR"
-    elif against_percent > abstain_percent:
-        max_percent, recommendation = against_percent, "AGAINST"
-    else:
-        max_percent, recommendation = abstain_percent, "NO RECOMMENDATION"
-    
     if max_percent > 50:
         mandatory = "BINDING"
 
-    string_out += f"{mandatory} vote {recommendation}, by a vote of {for_percent}% FOR, {against_percent}% AGAINST, and {nonvote_percent}% ({len(nonvoters)} members) absent.\n\n"
-    string_out += f"vote, power, percentage, regions\n"
-    string_out += f"FOR, {for_power}, {for_percent}, {','.join(flags_args['--for']) if flags_args['--for'] else None},\nAGAINST, {against_power}, {against_percent}, {','.join(flags_args['--against']) if flags_args['--against'] else None},\nABSTAIN, {abstain_power}, {abstain_percent}, {','.join(flags_args['--abstain']) if flags_args['--abstain'] else None},\nNon-Voting, {nonvote_power}, {nonvote_percent}, {','.join(nonvoters) if nonvoters != [] else "None"}"
-    
+    # regions given more than one vote count towards the first of FOR, AGAINST and ABSTAIN, as above
+    votes = {region : vote for vote, flag in (("ABSTAIN", "--abstain"), ("AGAINST", "--against"), ("FOR", "--for")) for region in flags_args[flag]}
+
+    # a swing analysis is of a vote still going on, so its tally is not the final one
+    if "--swing" in flags:
+        resolutions = []
+
+    for resolution in resolutions:
+        history.RecordTally(resolution, recommendation, mandatory == "BINDING", (for_percent, against_percent, abstain_percent, nonvote_percent), [(region[0], votes.get(region[0], "NONE"), region[3]) for region in regions_power])
+
     if nums_only:
-        return {"consensus" : recommendation, "aye" : [for_percent, [x.replace("_", " ").title() for x in flags_args["--for"]]], "nay" : [against_percent, [x.replace("_", " ").title() for x in flags_args["--against"]]], "abstain" : [abstain_percent, [x.replace("_", " ").title() for x in flags_args["--abstain"]]], "turnout" : [len(regions_power[:-1])-len(nonvoters), len(regions_power[:-1]), 100.0-nonvote_percent]}
-    if not "--export":
-        return string_out
+        return {"consensus" : recommendation, "aye" : [for_percent, [x.replace("_", " ").title() for x in flags_args["--for"]]], "nay" : [against_percent, [x.replace("_", " ").title() for x in flags_args["--against"]]], "abstain" : [abstain_percent, [x.replace("_", " ").title() for x in flags_args["--abstain"]]], "turnout" : [len(regions_power)-len(nonvoters), len(regions_power), 100.0-nonvote_percent]}
+
+    sides = [("FOR", for_power, for_percent, flags_args["--for"]), ("AGAINST", against_power, against_percent, flags_args["--against"]), ("ABSTAIN", abstain_power, abstain_percent, flags_args["--abstain"]), ("Non-Voting", nonvote_power, nonvote_percent, nonvoters)]
+    string_out = f"{mandatory} vote {recommendation}, by a vote of {for_percent}% FOR, {against_percent}% AGAINST, and {nonvote_percent}% ({len(nonvoters)} members) absent.\n\n"
+
+    if "--swing" in flags:
+        nonvoter_set = set(nonvoters)
+        swing_out = "\n" + _SwingAnalysis([for_power, against_power, abstain_power], total_power, [(region[0], region[3]) for region in regions_power if region[0] in nonvoter_set])
+    else:
+        swing_out = ""
+
+    return _VoteReport(string_out, sides, swing_out, regions_power, votes, "--export" in flags)
+
+def _VoteReport(summary : str, sides : list[tuple], swing_out : str, regions_power : list, votes : dict, export : bool):
+    """Yields calc_vote's report a piece at a time, so the regions of each side are never all joined into one string. If exporting,
+    each piece is also written to the report file as it is yielded, and each region's vote to the export files."""
+    with contextlib.ExitStack() as exports:
+        write, write_row = (lambda chunk: None), (lambda row: None)
+
+        if export:
+            timestamp = time.strftime("%Y%m%d%H%M%S", time.gmtime())
+            write = exports.enter_context(open(state.OutputName(f"{timestamp}_vote_report.csv"), "w")).write
+            write_row = exports.enter_context(report.Export(state.OutputName(f"{timestamp}_votes"), ["region", "vote", "power"], config.export_formats))
+
+        def _Chunks():
+            yield summary + "vote, power, percentage, regions\n"
+
+            for index, (side, power, percent, regions) in enumerate(sides):
+                yield f"{side}, {power}, {percent}, "
+
+                # the regions are yielded in chunks, rather than one at a time or all at once
+                for start in range(0, len(regions), 100):
+                    yield ("," if start else "") + ",".join(regions[start:start+100])
+
+                if regions == []:
+                    yield "None"
+
+                yield ",\n" if index < len(sides)-1 else "\n"
+
+            yield swing_out
+
+        for chunk in _Chunks():
+            write(chunk)
+            yield chunk
 
-    with open(f"{time.strftime("%Y%M%d%H%M%S", time.gmtime())}_vote_report.csv", "w") as report_file:
-        report_file.write(string_out)
-        return string_out
+        for region in regions_power:
+            write_row((region[0], votes.get(region[0], "NONE"), region[3]))
+
+    return 0
 
 def MakeDispatch(client : nationstates.Nationstates, flags : list, *args):
-    """Create a recommendation dispatch for the current resolution based on the region dossier or a manually provided subset. flags:\n\n--type [type] -> the type of the resolution to fetch (either "sc" or "ga")\n--forum [link] a link to the forum post for the resolution\n--for [regions] --against [regions] --abstain [regions] -> manually provide regions for, against or abstaining from the vote\n--input -> be prompted to input each nation's vote INSTEAD OF PROVIDING INPUT TO OTHER FLAGS FOR THE VOTES.\n\nThis function uses the file-path for the template as defined in config.py"""
+    """Create a recommendation dispatch for the current resolution based on the region dossier or a manually provided subset. flags:\n\n--type [type] -> the type of the resolution to fetch ("ga", "sc", or both to make a dispatch for each from the same votes)\n--forum [link] a link to the forum post for the resolution\n--for [regions] --against [regions] --abstain [regions] -> manually provide regions for, against or abstaining from the vote\n--input -> be prompted to input each nation's vote INSTEAD OF PROVIDING INPUT TO OTHER FLAGS FOR THE VOTES.\n--template [names] -> the templates (as named in config.py) to make the dispatch from; defaults to "default"\n--fresh -> ignore the cached resolution and fetch it again.\n--bloc [names] -> run for each of the blocs [names] (from config.py) instead of the default bloc.\n\nThe file-paths of the templates are defined in config.py"""
     flags_args = _MatchFlagsArgs(flags, args[0] if args else [])
     if isinstance(flags_args, tuple):
         return flags_args
     
-    match flags_args["--type"]:
-        case ["ga"]:
-            wa_object = client.wa(1)
-            res_type = "GENERAL ASSEMBLY"
-        case ["sc"]:
-            wa_object = client.wa(2)
-            res_type = "SECURITY COUNCIL"
-        case ["ga", "sc"]:
-            return (-1, "A resolution can only be one of 'ga' and 'sc', not both")
-        case _:
-            return (-1, f"Unknown flag provided: '{flags[0]}'")
+    chambers = []
+
+    for res_type in dict.fromkeys(flags_args.get("--type", [])):
+        match res_type:
+            case "ga":
+                chambers.append((res_type, 1, "GENERAL ASSEMBLY"))
+            case "sc":
+                chambers.append((res_type, 2, "SECURITY COUNCIL"))
+            case _:
+                return (-1, f"Unknown resolution type provided: '{res_type}'")
+
+    if chambers == []:
+        return (-1, "The type of the resolution must be provided with --type")
+
+    template_names = list(dict.fromkeys(flags_args.get("--template") or ["default"]))
+    templates = config.dispatch_templates | {"default" : state.Path("reccomendation_dispatch_file")}
+    unknown_templates = [name for name in template_names if name not in templates]
+
+    if unknown_templates != []:
+        return (-1, f"Unknown templates provided: {', '.join(unknown_templates)}")
+
+    template_paths = [templates[name] for name in template_names]
+
+    # compile the templates before asking for any votes, so that a broken template is found straight away
+    try:
+        for path in template_paths:
+            template.Load(path)
+    except (OSError, ValueError) as error:
+        return (-1, str(error))
+
+    # fetch the resolutions before asking for any votes, so the tally can be archived under them
+    resolutions = []
+
+    for _, chamber, res_type in chambers:
+        try:
+            resolutions.append((res_type, fetch.FetchResolution(client, chamber)))
+        except LookupError:
+            return (-1, f"No resolution is currently at vote in the {res_type}")
+
+    resolution_ids = [fetch.ResolutionId(resolution) for _, resolution in resolutions]
         
     if any(x in flags for x in ["--for", "--against", "--abstain"]):
-        numbers_output = CalculateVotes(client, ["--for", "--against", "--abstain"], True, flags_args["--for"], flags_args["--against"], flags_args["--abstain"])
+        numbers_output = CalculateVotes(client, ["--for", "--against", "--abstain", "--resolution"], [flags_args.get("--for", []), flags_args.get("--against", []), flags_args.get("--abstain", []), resolution_ids], nums_only=True)
     else:
-        numbers_output = CalculateVotes(client, ["--input"], True)
+        numbers_output = CalculateVotes(client, ["--input", "--resolution"], [resolution_ids], nums_only=True)
+
+    if isinstance(numbers_output, tuple):
+        return numbers_output
 
     for x in ("aye", "nay", "abstain"):
         numbers_output[x][1] = "".join([f"[*] [region]{region}[/region]\n" for region in numbers_output[x][1]])
 
-    resolution = wa_object.resolution
-    prop_name = resolution["name"]
-    author = resolution["proposed_by"]
-    res_content = resolution["desc"]
-    forum_link = flags_args["--forum"][0] if flags_args["--forum"] else "https://forum.nationstates.net/viewforum.php?f=8"
-    
-    res_content = res_content.replace("&#146;", "'")
-    res_content = res_content.replace("&quot;", "\"")
-    
-    try:
-        coauthor = ", ".join([f"[nation]{x}[/nation]" for x in resolution["coauthor"].values()])
-    except KeyError:
-        coauthor = ""
-
-    full_contents = res_content + f"{"\n\nCoauthor: " if coauthor != "" else ""}{coauthor}"
-
-    tags = ["$name", "$auth", "$con", "$typ", "$for","$aye", "$avt","$nay", "$nvt", "$abs", "$abvt","$tof", "$tow"]
-    replace_values = [prop_name, author, full_contents, res_type, forum_link, round(numbers_output["aye"][0], 2), numbers_output["aye"][1], round(numbers_output["nay"][0], 2), numbers_output["nay"][1], round(numbers_output["abstain"][0],2), numbers_output["abstain"][1], f"{numbers_output["turnout"][0]}/{numbers_output["turnout"][1]}", numbers_output["turnout"][2]]
-    replace_values = [str(x) for x in replace_values]
-
-    with open(config.reccomendation_dispatch_file, "r") as dispatch_file:
-        contents = dispatch_file.read()
-
-        match numbers_output["consensus"]:
-            case "FOR":
-                contents = contents.replace("$rec", "[color=#2fc657][u]FOR[/u][/color]")
-                contents = contents.replace("AYES: $aye%", "[b]AYES: $aye%[/b]")
-            case "AGAINST":
-                contents = contents.replace("$rec", "[color=#ea4335][u]AGAINST[/u][/color]")
-                contents = contents.replace("NAYS: $nay%", "[b]NAYS: $nay%[/b]")
-            case "NO RECOMMENDATION":
-                contents = contents.replace("vote [/color]$rec", "[/color] [u]ABSTAIN ON[/u]")
-                contents = contents.replace("ABSTENTIONS: $abs%", "[b]ABSTENTIONS: $abs%[/b]")
-
-        for item in tuple(zip(tags, replace_values)):
-            contents = contents.replace(*item)
-
-        with open(f"{time.strftime("%Y%m%d%H%M%S", time.gmtime())}_recommendation_dispatch.txt", "w") as output:
+    forum_link = flags_args["--forum"][0] if flags_args.get("--forum") else "https://forum.nationstates.net/viewforum.php?f=8"
+
+    vote_values = {"for" : forum_link,
+                   "aye" : str(round(numbers_output["aye"][0], 2)), "avt" : numbers_output["aye"][1],
+                   "nay" : str(round(numbers_output["nay"][0], 2)), "nvt" : numbers_output["nay"][1],
+                   "abs" : str(round(numbers_output["abstain"][0], 2)), "abvt" : numbers_output["abstain"][1],
+                   "tof" : f"{numbers_output["turnout"][0]}/{numbers_output["turnout"][1]}", "tow" : str(numbers_output["turnout"][2])}
+    values_list = []
+
+    for res_type, resolution in resolutions:
+        res_content = resolution["desc"]
+        res_content = res_content.replace("&#146;", "'")
+        res_content = res_content.replace("&quot;", "\"")
+        
+        try:
+            coauthor = ", ".join([f"[nation]{x}[/nation]" for x in resolution["coauthor"].values()])
+        except KeyError:
+            coauthor = ""
+
+        full_contents = res_content + f"{"\n\nCoauthor: " if coauthor != "" else ""}{coauthor}"
+
+        values_list.append(vote_values | {"name" : resolution["name"], "auth" : resolution["proposed_by"], "con" : full_contents, "typ" : res_type})
+
+    dispatches = template.RenderAll(template_paths, values_list, numbers_output["consensus"])
+    timestamp = time.strftime("%Y%m%d%H%M%S", time.gmtime())
+
+    if len(dispatches) == 1:
+        file_names = [f"{timestamp}_recommendation_dispatch.txt"]
+    else:
+        file_names = [f"{timestamp}_{name}_{chamber[0]}_recommendation_dispatch.txt" for name in template_names for chamber in chambers]
+
+    for file_name, contents in zip(file_names, dispatches):
+        with open(state.OutputName(file_name), "w") as output:
             output.write(contents)
 
     return 0
 
-    # dispatch template tokens:
-    # $name -> proposal name
-    # $auth -> author
-    # $con -> content of the proposal, author, coauthor [NOFLAG]
-    # $typ -> type of the proposal (ga/sc) [NOFLAG]
-    # $for -> forum link [FLAGGED]
-    # $rec -> recommendation [NOFLAG -> GET FROM CSV]
 
-    # $aye -> aye % (weighted)
-    # $avt -> regions voting aye
+def ManageCache(client : nationstates.Nationstates, flags : list, *args):
+    """Show how many API requests the response cache has saved this session, or clear it. Flags:\n\n--clear [kinds] -> remove cached responses of the given kinds (delegate, votes, power, chamber_votes, resolution_id, resolution).\n\nIf --clear is given without kinds, the whole cache is cleared. With no flags, the cache hit and miss counts are shown."""
+    if "--clear" in flags:
+        kinds = args[0][0] if args[0] else [None]
+
+        if any(kind not in config.cache_ttls for kind in kinds if kind is not None):
+            return (-1, f"Unknown cache kind provided, expected any of: {', '.join(config.cache_ttls)}")
+
+        removed = sum(cache.Invalidate(kind) for kind in kinds)
+        return f"Removed {removed} cached responses"
+
+    string_out = "{:25}{:>8}{:>8}\n".format("kind", "hits", "misses")
+
+    for kind in config.cache_ttls:
+        string_out += "{:25}{:8}{:8}\n".format(kind, cache.hits.get(kind, 0), cache.misses.get(kind, 0))
+
+    string_out += "{:25}{:8}{:8}\n".format("TOTAL", sum(cache.hits.values()), sum(cache.misses.values()))
+    string_out += f"\n{cache.EntryCount()} responses cached, {sum(cache.hits.values())} requests saved this session"
+
+    return string_out
+
+def ShowStats(client : nationstates.Nationstates, flags : list, *args):
+    """Show how long recent commands took and what they spent it on. Flags:\n\n--last [number] -> show this many of the most recent commands (10 by default).\n--clear -> forget the commands measured so far.\n\nFor each command, the wall time, API requests, kilobytes received, and time spent on the network, waiting for the rate limit, and reading and writing files are shown, followed by the averages for each kind of command. Network and waiting times are summed across threads, so can be longer than the wall time. Set trace_file in config.py to also log every command and request to a file."""
+    if "--clear" in flags:
+        stats.Clear()
+        return "Cleared the command statistics"
+
+    try:
+        last = int(args[0][0][0]) if "--last" in flags and args[0] else 10
+    except ValueError:
+        return (-1, f"Invalid number of commands: '{args[0][0][0]}'")
+
+    records = [record for record in stats.records if record["command"].split()[0] != "stats"]
+
+    if records == []:
+        return "No commands have been measured yet"
+
+    row_format = "{:30.30}{:>10}{:>10}{:>10}{:>10}{:>11}{:>8}\n"
+    string_out = row_format.format("command", "wall (s)", "requests", "KB", "net (s)", "wait (s)", "io (s)")
+
+    for record in records[-last:]:
+        string_out += row_format.format(record["command"] if record["succeeded"] else f"{record["command"]} (failed)", f"{record["wall"]:.2f}", record["requests"], f"{record["bytes"] / 1024:.1f}", f"{record["network"]:.2f}", f"{record["throttled"]:.2f}", f"{record["io"]:.3f}")
+
+    string_out += "\naverages:\n" + row_format.format("command", "wall (s)", "requests", "KB", "net (s)", "wait (s)", "io (s)")
+    by_command = {}
+
+    for record in records:
+        by_command.setdefault(record["command"].split()[0], []).append(record)
+
+    for command, command_records in by_command.items():
+        count = len(command_records)
+        averages = {key : sum(record[key] for record in command_records) / count for key in ("wall", "requests", "bytes", "network", "throttled", "io")}
+        string_out += row_format.format(f"{command} (x{count})", f"{averages["wall"]:.2f}", f"{averages["requests"]:.1f}", f"{averages["bytes"] / 1024:.1f}", f"{averages["network"]:.2f}", f"{averages["throttled"]:.2f}", f"{averages["io"]:.3f}")
+
+    return string_out
+
+def _Streaks(record : list[bool]) -> tuple[int, int]:
+    """Returns the current and longest runs of compliance in a region's record, which is oldest first."""
+    current, longest = 0, 0
+
+    for compliant in record:
+        current = current + 1 if compliant else 0
+        longest = max(longest, current)
+
+    return current, longest
+
+def _HistoryNumber(flags_args : dict, flag : str, default : int) -> int | tuple:
+    try:
+        return int(flags_args[flag][0]) if flags_args.get(flag) else default
+    except ValueError:
+        return (-1, f"Invalid number for {flag}: '{flags_args[flag][0]}'")
+
+def ShowHistory(client : nationstates.Nationstates, flags : list, *args):
+    """Query the archive of vote tallies (from calc_vote and make_dispatch) and compliance checks. Flags:\n\n--participation [number] -> show how many of the last [number] tallies each region voted in (the last 10 by default).\n--compliance [days] -> show each region's compliance rate and streaks over the last [days] days (90 by default).\n--region [regions] -> show the recent votes and compliance of each of [regions].\n--retally [number] -> tally the last [number] tallies again with the current power table, to compare with how they were tallied (the last 10 by default; needs numpy).\n--bloc [names] -> run for each of the blocs [names] (from config.py) instead of the default bloc.\n\nWith no flags, participation is shown. Only the latest tally and compliance check of each resolution are counted."""
+    flags_args = _MatchFlagsArgs(flags, args[0]) if args and args[0] else {}
+
+    if "--region" in flags and not flags_args.get("--region"):
+        return (-1, "No regions were provided")
+
+    string_out = ""
+
+    if "--participation" in flags or not flags:
+        last = _HistoryNumber(flags_args, "--participation", config.history_tallies)
+
+        if isinstance(last, tuple):
+            return last
+
+        tally_count, rows = history.Participation(last)
+
+        if tally_count == 0:
+            string_out += "No tallies have been archived yet\n"
+        else:
+            string_out += f"Votes cast in the last {tally_count} tallies:\n"
+
+            for region, cast, count in rows:
+                string_out += f"{region}{' '*(30-len(region))}-> {cast}/{count}\n"
 
-    # $nay -> nay % (weighted)
-    # $nvt -> regions voting nay
+            missed_all = [region for region, cast, _ in rows if cast == 0]
+            string_out += f"\nRegions which missed all of them: {', '.join(missed_all) if missed_all else 'None'}\n"
 
-    # $abs -> abstentions
-    # $abvt -> regions abstaining
+    if "--compliance" in flags:
+        days = _HistoryNumber(flags_args, "--compliance", config.history_term_days)
 
-    # $tof -> turnout as a fraction
-    # $tow -> turnout % (weighted)
+        if isinstance(days, tuple):
+            return days
 
+        records = history.ComplianceRecords(time.time() - days * 24 * 60 * 60)
+
+        if records == {}:
+            string_out += f"No compliance checks have been archived in the last {days} days\n"
+        else:
+            string_out += f"Compliance in the last {days} days:\n" + "{:30}{:>10}{:>10}{:>10}{:>10}\n".format("region", "checks", "rate (%)", "streak", "longest")
+
+            # least compliant first
+            for region, record in sorted(records.items(), key=lambda item: (sum(item[1]) / len(item[1]), item[0])):
+                current, longest = _Streaks(record)
+                string_out += "{:30}{:10}{:10.1f}{:10}{:10}\n".format(region, len(record), sum(record) / len(record) * 100, current, longest)
+
+    if "--retally" in flags:
+        last = _HistoryNumber(flags_args, "--retally", config.history_tallies)
+
+        if isinstance(last, tuple):
+            return last
+
+        # numpy is only loaded for retallies
+        import tally
+
+        tallies, votes = history.Tallies(last)
+        power_rows = state.PowerRows()
+        regions = sorted({region for _, region, _ in votes})
+        tally_ids = [tally_row[0] for tally_row in tallies]
+
+        # each tally is of the regions in it, and those which have since left the dossier have no power in the current table
+        results = tally.Tally(tally.VoteMatrix(regions, tally_ids, votes), [power_rows[region][3] if region in power_rows else 0 for region in regions])
+
+        string_out += f"\nThe last {len(tallies)} tallies, as tallied then and with the current power table:\n"
+
+        for index, (_, recorded, resolution, recommendation, binding, for_percent) in enumerate(tallies):
+            label = resolution or "unnamed tally"
+            then = f"{'BINDING' if binding else 'NON-BINDING'} {recommendation} ({for_percent}% FOR)"
+            now = f"{'BINDING' if results['binding'][index] else 'NON-BINDING'} {results['recommendation'][index]} ({results['percent'][0, index]}% FOR)"
+            string_out += f"{time.strftime('%Y-%m-%d %H:%M', time.gmtime(recorded))}  {label}{' '*(30-len(label))}-> {then}, now {now}\n"
+
+    for region in flags_args.get("--region", []):
+        string_out += f"\n{region}:\nvotes:\n"
+
+        for recorded, resolution, vote, recommendation in history.RegionVotes(region, config.history_tallies):
+            string_out += f"{time.strftime('%Y-%m-%d %H:%M', time.gmtime(recorded))}  {resolution or 'unnamed tally'}{' '*(30-len(resolution or 'unnamed tally'))}-> {vote} (recommendation: {recommendation})\n"
+
+        string_out += "compliance:\n"
+
+        for recorded, chamber, resolution, delegate, vote, compliant in history.RegionCompliance(region, config.history_tallies):
+            outcome = "could not be checked" if compliant is None else f"{'compliant' if compliant else 'non-compliant'} (delegate: {delegate}, vote: {vote})"
+            label = f"{chamber} {resolution or 'unknown resolution'}"
+            string_out += f"{time.strftime('%Y-%m-%d %H:%M', time.gmtime(recorded))}  {label}{' '*(30-len(label))}-> {outcome}\n"
+
+    return string_out
 
 def DisplayHelp(client : nationstates.Nationstates, flags : list, *args):
     "display help for (a) command(s). Flags:\n\n--[name of command] -> display help for [command].\n\nMultiple command flags may be chained together. No flags displays help for all commands."
@@ -407,15 +888,16 @@ def DisplayHelp(client : nationstates.Nationstates, flags : list, *args):
     if not flags:
         for item in list(config.commands_list.keys()):
             print(item)
-            print(config.commands_list[item].__doc__+ "\n" +("-"*10)+"\n")
+            print(config.GetCommand(item).__doc__+ "\n" +("-"*10)+"\n")
     else:
         for item in flags:
             print(item)
-            print(config.commands_list[item.strip("--")].__doc__ + "\n" +("-"*10)+"\n")
+            print(config.GetCommand(item.strip("--")).__doc__ + "\n" +("-"*10)+"\n")
 
     return 0
 
 def Exit(client, flags, *args) -> None:
+    "exit the program."
     os._exit(0)
     
 
@@ -1,30 +1,113 @@
-import commands
+import importlib
 from types import FunctionType
 
-commands_list : dict[str, FunctionType] = {"compliance"    : commands.CheckCompliance, 
-                                           "dossier"       : commands.ModifyDossier,
-                                           "region_list"   : commands.ListRegions,
-                                           "rec_update"    : commands.UpdateRecs,
-                                           "power_refresh" : commands.RefreshPower,
-                                           "calc_vote"     : commands.CalculateVotes,
-                                           "make_dispatch" : commands.MakeDispatch,
-                                           "help"          : commands.DisplayHelp, 
-                                           "exit"          : commands.Exit}
-
-acceptable_flags : dict[str, list] = {"compliance"    : ["--ga", "--sc", "--export"], 
-                                      "dossier"       : ["--add", "--del"],
-                                      "region_list"   : None,
-                                      "rec_update"    : ["--ga", "--sc"],
-                                      "power_refresh" : ["--regions", "--export"],
-                                      "calc_vote"     : ["--input", "--for", "--against", "--abstain", "--export"],
-                                      "make_dispatch" : ["--type", "--input", "--forum", "--for", "--against", "--abstain"],
+# each command's handler, as "module.function". A handler's module is only imported when the command (or help) is first run
+commands_list : dict[str, str] = {"compliance"    : "commands.CheckCompliance", 
+                                  "watch"         : "commands.WatchCompliance",
+                                  "dossier"       : "commands.ModifyDossier",
+                                  "region_list"   : "commands.ListRegions",
+                                  "rec_update"    : "commands.UpdateRecs",
+                                  "power_refresh" : "commands.RefreshPower",
+                                  "calc_vote"     : "commands.CalculateVotes",
+                                  "make_dispatch" : "commands.MakeDispatch",
+                                  "cache"         : "commands.ManageCache",
+                                  "stats"         : "commands.ShowStats",
+                                  "history"       : "commands.ShowHistory",
+                                  "help"          : "commands.DisplayHelp", 
+                                  "exit"          : "commands.Exit"}
+
+# commands which never use the API, so are run without creating an API client (or loading the libraries it needs)
+offline_commands : list[str] = ["dossier", "region_list", "rec_update", "calc_vote", "cache", "stats", "history", "help", "exit"]
+
+def GetCommand(command : str) -> FunctionType:
+    """Returns the handler of a command, importing its module if it has not been already."""
+    module_name, function_name = commands_list[command].rsplit(".", 1)
+    return getattr(importlib.import_module(module_name), function_name)
+
+acceptable_flags : dict[str, list] = {"compliance"    : ["--ga", "--sc", "--export", "--fast", "--remap", "--fresh", "--bloc"], 
+                                      "watch"         : ["--regions", "--chambers", "--interval", "--rounds"],
+                                      "dossier"       : ["--add", "--del", "--bloc"],
+                                      "region_list"   : ["--bloc"],
+                                      "rec_update"    : ["--ga", "--sc", "--bloc"],
+                                      "power_refresh" : ["--regions", "--export", "--fresh", "--dump", "--stale", "--bloc"],
+                                      "calc_vote"     : ["--input", "--for", "--against", "--abstain", "--resolution", "--export", "--swing", "--bloc"],
+                                      "make_dispatch" : ["--type", "--input", "--forum", "--for", "--against", "--abstain", "--template", "--fresh", "--bloc"],
+                                      "cache"         : ["--clear"],
+                                      "stats"         : ["--last", "--clear"],
+                                      "history"       : ["--participation", "--compliance", "--region", "--retally", "--bloc"],
                                       "help"          : None,
                                       "exit"          : None}
 
-nonargument_flags : list[str]     = ["--export", "--input"]
+# commands which do not change the dossier, recommendations or powers, so can run at the same time in batch mode
+concurrent_commands : list[str] = ["compliance", "watch", "region_list", "calc_vote", "make_dispatch"]
+
+nonargument_flags : list[str]     = ["--export", "--input", "--fast", "--remap", "--fresh", "--dump", "--swing"]
+
+# flags whose argument can be left out. When it is, the flag is given an empty argument, so the arguments of the flags after it
+# still line up with them
+optional_argument_flags : list[str] = ["--stale", "--participation", "--compliance", "--retally"]
 
 region_file          : str = "regions.csv"
 recommendations_file : str = "recommendations.csv"
 votepower_file       : str = "votepower.csv"
 reccomendation_dispatch_file : str = "dispatch_template.txt"
+cache_file           : str = "cache.sqlite3"
+history_file         : str = "history.sqlite3"
+regions_dump_file    : str = "regions.xml.gz"
+nations_dump_file    : str = "nations.xml.gz"
+
+# the formats ("csv" and/or "json", see report.FORMATS) compliance --export and calc_vote --export write each region's result in,
+# alongside their reports
+export_formats : list[str] = ["csv"]
+
+# the templates make_dispatch can use with --template, by name. A bloc's own template (see below) is its "default"
+dispatch_templates : dict[str, str] = {"default" : reccomendation_dispatch_file}
+
+# named blocs, each with its own dossier, recommendations, power table, template and history. A bloc names the files it uses in
+# place of the ones above, by the same names; any it leaves out are those of the "default" bloc, which commands use unless given
+# --bloc [names]. For example:
+#     "other" : {"region_file" : "other_regions.csv", "recommendations_file" : "other_recommendations.csv", "votepower_file" : "other_votepower.csv",
+#                "reccomendation_dispatch_file" : "other_dispatch_template.txt", "history_file" : "other_history.sqlite3"}
+blocs : dict[str, dict[str, str]] = {"default" : {}}
+
+fetch_workers      : int = 8
+ratelimit_requests : int = 40
+ratelimit_window   : int = 30
+
+# once the server's rate limit headers have been seen, requests are kept ratelimit_margin below its limit. Up to ratelimit_burst
+# requests can be sent at once, with the rest spread over the window. After a 429, requests are slowed (down to ratelimit_min_factor
+# of the usual rate) and tried again up to ratelimit_retries times
+ratelimit_margin     : int   = 2
+ratelimit_burst      : int   = 5
+ratelimit_min_factor : float = 0.125
+ratelimit_retries    : int   = 3
+
+# commands whose requests wait for those of the commands run at the same time as them (in a parallel batch). power_refresh changes
+# the powers, so is never run alongside another command
+background_commands : list[str] = ["watch"]
+
+# how long (in seconds) each kind of cached response is used for before being fetched again
+cache_ttls : dict[str, int] = {"delegate"      : 6 * 60 * 60,
+                               "votes"         : 60,
+                               "power"         : 60 * 60,
+                               "chamber_votes" : 60,
+                               "resolution_id" : 60,
+                               "resolution"    : 7 * 24 * 60 * 60}
+
+cache_max_entries : int = 50000
+
+# how old (in seconds) a region's power can be before power_refresh --stale fetches it again
+power_max_age : int = 24 * 60 * 60
+
+# how often (in seconds) watch checks compliance, how many delegates it re-checks each time, and where it logs changes
+watch_interval        : int = 60
+watch_delegate_checks : int = 10
+watch_log_file        : str = "watch_log.txt"
+
+# how many commands stats keeps the measurements of, and a file to append every command and request to as JSON lines (None for no trace)
+stats_history : int        = 100
+trace_file    : str | None = None
 
+# how many tallies history --participation looks back over, and how far back (in days) history --compliance looks by default
+history_tallies   : int = 10
+history_term_days : int = 90
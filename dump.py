@@ -0,0 +1,50 @@
+import gzip
+import xml.etree.ElementTree as ElementTree
+
+def _Canonicalise(name : str) -> str:
+    return name.strip().replace(" ", "_").lower()
+
+def _IterElements(dump_path : str, tag : str):
+    """Stream-parses a gzipped NationStates dump, yielding each element with the given tag. Each element is cleared once the
+    caller is done with it, so memory use stays constant however large the dump is."""
+    with gzip.open(dump_path, "rb") as dump_file:
+        events = ElementTree.iterparse(dump_file, events=("start", "end"))
+        _, root = next(events)
+
+        for event, element in events:
+            if event == "end" and element.tag == tag:
+                yield element
+                root.clear()
+
+def ReadRegionPower(regions_dump : str, nations_dump : str, regions : list) -> list[tuple[str, dict | None, str | None]]:
+    """Reads the delegate votes and number of WA nations of each region from the daily regions and nations dumps, in a single pass
+    over each. Returns (region, result, error) tuples in the same order as regions, like fetch.FetchAll."""
+    wanted = set(regions)
+    delegate_votes, wa_nations = {}, {}
+
+    for element in _IterElements(regions_dump, "REGION"):
+        name = _Canonicalise(element.findtext("NAME", ""))
+
+        if name in wanted:
+            delegate_votes[name] = int(element.findtext("DELEGATEVOTES", "0"))
+            wa_nations[name] = 0
+
+    for element in _IterElements(nations_dump, "NATION"):
+        if element.findtext("UNSTATUS", "") not in ("WA Member", "WA Delegate"):
+            continue
+
+        region = _Canonicalise(element.findtext("REGION", ""))
+
+        if region in wa_nations:
+            wa_nations[region] += 1
+
+    results = []
+
+    for region in regions:
+        if region not in delegate_votes:
+            results.append((region, None, "region not found in the dump"))
+            continue
+
+        results.append((region, {"region" : region, "delegatevotes" : delegate_votes[region], "numwanations" : wa_nations[region]}, None))
+
+    return results
@@ -0,0 +1,188 @@
+from __future__ import annotations
+
+import collections
+import contextvars
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+import cache
+import config
+import scheduler
+
+if TYPE_CHECKING:
+    import nationstates
+
+# (kind, key) -> the result of a lookup still being made, which identical lookups made meanwhile wait on and share
+_shared      : dict[tuple, Future] = {}
+_shared_lock : threading.Lock      = threading.Lock()
+
+def _Request(request):
+    """Makes a request once the scheduler allows it, trying again (after the wait the server asks for) if it is refused for going
+    over the rate limit."""
+    # the API client (and so nationstates) has been loaded by the time a request is made
+    from nationstates.exceptions import APIRateLimitBan
+
+    for attempt in range(config.ratelimit_retries + 1):
+        scheduler.Acquire()
+
+        try:
+            return request()
+        except APIRateLimitBan:
+            if attempt == config.ratelimit_retries:
+                raise
+
+def ClearShared() -> None:
+    """Forgets the lookups shared so far, so that the next command fetches (or reads from the cache) its data again."""
+    with _shared_lock:
+        _shared.clear()
+
+def _Shared(kind : str, key : str, lookup):
+    """Returns the result of lookup. Identical lookups made at the same time share the first one's result. Once it is done it is
+    forgotten, so that results are not all kept in memory; later identical lookups read it from the cache instead (see _Cached)."""
+    with _shared_lock:
+        future = _shared.get((kind, key))
+        is_first = future is None
+
+        if is_first:
+            future = Future()
+            _shared[(kind, key)] = future
+
+    if not is_first:
+        return future.result()
+
+    try:
+        value = lookup()
+    except BaseException as error:
+        future.set_exception(error)
+        raise
+    finally:
+        with _shared_lock:
+            if _shared.get((kind, key)) is future:
+                del _shared[(kind, key)]
+
+    future.set_result(value)
+    return value
+
+def _Cached(kind : str, key : str, request):
+    """Returns the cached value of kind for key, or makes the request (within the rate limit) and caches its result. The lookup
+    is shared as with _Shared."""
+
+    def _Lookup():
+        value = cache.Get(kind, key)
+
+        if value is None:
+            value = _Request(request)
+            cache.Put(kind, key, value)
+
+        return value
+
+    return _Shared(kind, key, _Lookup)
+
+def FetchDelegate(client : nationstates.Nationstates, region : str) -> dict:
+    """Fetch the delegate of a region ("0" if the region has no delegate)."""
+    return {"region" : region, "delegate" : _Cached("delegate", region, lambda: client.region(region).delegate)}
+
+def FetchDelegateVotes(client : nationstates.Nationstates, region : str) -> dict:
+    """Fetch the delegate of a region, and that delegate's GA and SC votes."""
+    delegate = FetchDelegate(client, region)["delegate"]
+
+    if delegate == "0":
+        raise LookupError("region has no delegate")
+
+    votes = _Cached("votes", delegate, lambda: dict(client.nation(delegate).get_shards("gavote", "scvote")))
+
+    return {"region" : region, "delegate" : delegate, "gavote" : votes["gavote"], "scvote" : votes["scvote"]}
+
+def ResolutionId(resolution : dict) -> str:
+    """The id of a resolution (its name, if the API did not give one)."""
+    return resolution.get("id") or resolution["name"]
+
+def _CacheResolution(chamber : int, resolution : dict) -> None:
+    """Caches a resolution by its id, and records it as the one at vote in the chamber."""
+    resolution_id = ResolutionId(resolution)
+
+    cache.Put("resolution", resolution_id, resolution)
+    cache.Put("resolution_id", str(chamber), resolution_id)
+
+def FetchChamberVotes(client : nationstates.Nationstates, chamber : int) -> dict[str, str]:
+    """Fetch the vote of every delegate who has voted on the resolution at vote in a chamber (1 for the GA, 2 for the SC), keyed by delegate."""
+
+    def _FetchVotes() -> dict:
+        resolution = client.wa(chamber).get_shards("resolution", "delvotes")["resolution"]
+
+        if resolution is None:
+            raise LookupError("no resolution is at vote")
+
+        votes = {}
+
+        for shard, vote in (("delvotes_for", "FOR"), ("delvotes_against", "AGAINST")):
+            delegates = (resolution.pop(shard, None) or {}).get("delegate", [])
+
+            # a single delegate is parsed as a dict rather than a list of them
+            if isinstance(delegates, dict):
+                delegates = [delegates]
+
+            for delegate in delegates:
+                votes[delegate["nation"]] = vote
+
+        # the rest of the response is the resolution itself, which make_dispatch can use
+        _CacheResolution(chamber, resolution)
+
+        return votes
+
+    return _Cached("chamber_votes", str(chamber), _FetchVotes)
+
+def FetchResolution(client : nationstates.Nationstates, chamber : int) -> dict:
+    """Fetch the resolution at vote in a chamber."""
+
+    def _Lookup() -> dict:
+        resolution_id = cache.Get("resolution_id", str(chamber))
+        resolution = cache.Get("resolution", resolution_id) if resolution_id is not None else None
+
+        if resolution is None:
+            resolution = _Request(lambda: client.wa(chamber).resolution)
+
+            if resolution is None:
+                raise LookupError("no resolution is at vote")
+
+            _CacheResolution(chamber, resolution)
+
+        return resolution
+
+    return _Shared("resolution_at_vote", str(chamber), _Lookup)
+
+def FetchRegionPower(client : nationstates.Nationstates, region : str) -> dict:
+    """Fetch the delegate votes and number of WA nations in a region."""
+    shards = _Cached("power", region, lambda: dict(client.region(region).get_shards("delegatevotes", "numwanations")))
+
+    return {"region" : region, "delegatevotes" : int(shards["delegatevotes"]), "numwanations" : int(shards["numunnations"])}
+
+def FetchEach(client : nationstates.Nationstates, fetch_function, regions : list):
+    """Runs fetch_function for every region concurrently, yielding (region, result, error) tuples in the same order as regions as
+    soon as each (and those before it) is done; a region which failed has a result of None and the reason in error, and does not
+    stop the other regions being fetched. Only a few regions per worker are fetched ahead of the one being yielded, so results
+    are passed on as they come rather than all being held until the end."""
+
+    def _FetchOne(region : str) -> tuple:
+        try:
+            return (region, fetch_function(client, region), None)
+        except Exception as error:
+            return (region, None, str(error) or type(error).__name__)
+
+    in_flight = collections.deque()
+
+    with ThreadPoolExecutor(max_workers=config.fetch_workers) as executor:
+        for region in regions:
+            # each region is fetched in a copy of this thread's context, so its requests are measured as part of the current command
+            in_flight.append(executor.submit(contextvars.copy_context().run, _FetchOne, region))
+
+            if len(in_flight) >= config.fetch_workers * 2:
+                yield in_flight.popleft().result()
+
+        while in_flight:
+            yield in_flight.popleft().result()
+
+def FetchAll(client : nationstates.Nationstates, fetch_function, regions : list) -> list[tuple[str, dict | None, str | None]]:
+    """Runs fetch_function for every region concurrently, returning the results of FetchEach as a list."""
+    return list(FetchEach(client, fetch_function, regions))
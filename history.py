@@ -0,0 +1,136 @@
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import state
+
+# each bloc's archive (see config.blocs), by path
+_connections : dict[str, sqlite3.Connection] = {}
+_lock        : threading.Lock                = threading.Lock()
+
+# how many results of a compliance check are archived between each commit
+_COMMIT_EVERY : int = 500
+
+# only the latest tally of each resolution, and each region's latest compliance result for each resolution, count towards the
+# queries, so that running calc_vote and then make_dispatch, or checking compliance several times during a vote, does not count
+# the same vote more than once, and a later check of only some regions leaves the others' results counting. Those without a
+# resolution each count
+_LATEST_TALLIES = "SELECT MAX(id) FROM tallies WHERE recorded >= ? GROUP BY COALESCE(resolution, 'tally:' || id)"
+_LATEST_RESULTS = """SELECT latest.region, MAX(latest.check_id) FROM compliance_results AS latest JOIN compliance_checks AS latest_checks ON latest_checks.id = latest.check_id
+                     WHERE latest_checks.recorded >= ? {} GROUP BY latest.region, COALESCE(latest_checks.resolution, 'check:' || latest_checks.id), latest_checks.chamber"""
+
+def _Connect() -> sqlite3.Connection:
+    """Returns the archive of the current bloc."""
+    path = state.Path("history_file")
+    connection = _connections.get(path)
+
+    if connection is None:
+        connection = sqlite3.connect(path, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript("""
+            CREATE TABLE IF NOT EXISTS tallies (id INTEGER PRIMARY KEY, recorded REAL, resolution TEXT, recommendation TEXT, binding INTEGER,
+                                                for_percent REAL, against_percent REAL, abstain_percent REAL, nonvote_percent REAL);
+            CREATE TABLE IF NOT EXISTS tally_votes (tally_id INTEGER, region TEXT, vote TEXT, power INTEGER, PRIMARY KEY (region, tally_id)) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS compliance_checks (id INTEGER PRIMARY KEY, recorded REAL, chamber TEXT, resolution TEXT, recommendation TEXT);
+            CREATE TABLE IF NOT EXISTS compliance_results (check_id INTEGER, region TEXT, delegate TEXT, vote TEXT, compliant INTEGER, PRIMARY KEY (region, check_id)) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS tallies_recorded ON tallies (recorded);
+            CREATE INDEX IF NOT EXISTS tallies_resolution ON tallies (resolution);
+            CREATE INDEX IF NOT EXISTS tally_votes_tally ON tally_votes (tally_id);
+            CREATE INDEX IF NOT EXISTS compliance_checks_recorded ON compliance_checks (recorded);
+            CREATE INDEX IF NOT EXISTS compliance_checks_resolution ON compliance_checks (resolution, chamber);
+            CREATE INDEX IF NOT EXISTS compliance_results_check ON compliance_results (check_id);
+        """)
+        _connections[path] = connection
+
+    return connection
+
+def RecordTally(resolution : str | None, recommendation : str, binding : bool, percents : tuple, votes : list[tuple[str, str, int]]) -> None:
+    """Archives a vote tally: its (for, against, abstain, non-voting) percentages, and each region's (region, vote, power), where
+    the vote is FOR, AGAINST, ABSTAIN or NONE."""
+    with _lock:
+        connection = _Connect()
+
+        with connection:
+            tally_id = connection.execute("INSERT INTO tallies VALUES (NULL, ?, ?, ?, ?, ?, ?, ?, ?)", (time.time(), resolution, recommendation, int(binding), *percents)).lastrowid
+            connection.executemany("INSERT INTO tally_votes VALUES (?, ?, ?, ?)", [(tally_id, region, vote, power) for region, vote, power in votes])
+
+@contextmanager
+def RecordCompliance(chamber : str, resolution : str | None, recommendation : str | None):
+    """Archives a compliance check of one chamber, and yields a function which archives each region's result (region, delegate,
+    vote, compliant) as it comes, so that the results are not kept until the check is done. The delegate, vote and compliance of
+    a region which could not be checked are None."""
+    with _lock:
+        connection = _Connect()
+
+        with connection:
+            check_id = connection.execute("INSERT INTO compliance_checks VALUES (NULL, ?, ?, ?, ?)", (time.time(), chamber, resolution, recommendation)).lastrowid
+
+    recorded = [0]
+
+    def _Record(region : str, delegate : str | None, vote : str | None, compliant : bool | None) -> None:
+        with _lock:
+            connection.execute("INSERT INTO compliance_results VALUES (?, ?, ?, ?, ?)", (check_id, region, delegate, vote, None if compliant is None else int(compliant)))
+            recorded[0] += 1
+
+            if recorded[0] % _COMMIT_EVERY == 0:
+                connection.commit()
+
+    try:
+        yield _Record
+    except BaseException:
+        # a check which did not finish is not archived, as it would look like one of fewer regions
+        with _lock, connection:
+            connection.execute("DELETE FROM compliance_results WHERE check_id = ?", (check_id,))
+            connection.execute("DELETE FROM compliance_checks WHERE id = ?", (check_id,))
+
+        raise
+    else:
+        with _lock:
+            connection.commit()
+
+def Participation(last : int) -> tuple[int, list[tuple[str, int, int]]]:
+    """Returns how many of the last tallies there are, and each region's (region, votes cast, tallies it was in) over them, least
+    participating first."""
+    with _lock:
+        connection = _Connect()
+        tally_ids = [row[0] for row in connection.execute(f"SELECT id FROM tallies WHERE id IN ({_LATEST_TALLIES}) ORDER BY id DESC LIMIT ?", (0, last))]
+        rows = connection.execute(f"SELECT region, SUM(vote != 'NONE'), COUNT(*) FROM tally_votes WHERE tally_id IN ({', '.join('?' * len(tally_ids))}) GROUP BY region ORDER BY SUM(vote != 'NONE'), region", tally_ids).fetchall()
+
+    return len(tally_ids), rows
+
+def Tallies(last : int) -> tuple[list[tuple], list[tuple[int, str, str]]]:
+    """Returns the last tallies' (id, time, resolution, recommendation, binding, for percent), newest first, and every
+    (tally id, region, vote) in them."""
+    with _lock:
+        connection = _Connect()
+        tallies = connection.execute(f"SELECT id, recorded, resolution, recommendation, binding, for_percent FROM tallies WHERE id IN ({_LATEST_TALLIES}) ORDER BY id DESC LIMIT ?", (0, last)).fetchall()
+        votes = connection.execute(f"SELECT tally_id, region, vote FROM tally_votes WHERE tally_id IN ({', '.join('?' * len(tallies))})", [tally[0] for tally in tallies]).fetchall()
+
+    return tallies, votes
+
+def ComplianceRecords(since : float) -> dict[str, list[bool]]:
+    """Returns whether each region complied with each resolution (by its latest checked result) since the given time, oldest first."""
+    records = {}
+
+    with _lock:
+        rows = _Connect().execute(f"""SELECT results.region, results.compliant FROM compliance_results AS results JOIN compliance_checks AS checks ON checks.id = results.check_id
+                                      WHERE (results.region, results.check_id) IN ({_LATEST_RESULTS.format("AND latest.compliant IS NOT NULL")}) ORDER BY results.region, checks.id""", (since,))
+
+        for region, compliant in rows:
+            records.setdefault(region, []).append(bool(compliant))
+
+    return records
+
+def RegionVotes(region : str, last : int) -> list[tuple]:
+    """Returns a region's (time, resolution, vote, recommendation) in its last tallies, newest first."""
+    with _lock:
+        return _Connect().execute(f"""SELECT tallies.recorded, tallies.resolution, votes.vote, tallies.recommendation FROM tally_votes AS votes JOIN tallies ON tallies.id = votes.tally_id
+                                      WHERE votes.region = ? AND votes.tally_id IN ({_LATEST_TALLIES}) ORDER BY votes.tally_id DESC LIMIT ?""", (region, 0, last)).fetchall()
+
+def RegionCompliance(region : str, last : int) -> list[tuple]:
+    """Returns a region's (time, chamber, resolution, delegate, vote, compliant) in its last compliance checks, newest first."""
+    with _lock:
+        return _Connect().execute(f"""SELECT checks.recorded, checks.chamber, checks.resolution, results.delegate, results.vote, results.compliant FROM compliance_results AS results
+                                      JOIN compliance_checks AS checks ON checks.id = results.check_id
+                                      WHERE results.region = ? AND (results.region, results.check_id) IN ({_LATEST_RESULTS.format("")}) ORDER BY results.check_id DESC LIMIT ?""", (region, 0, last)).fetchall()
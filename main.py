@@ -1,11 +1,71 @@
-import nationstates
-import config
+from __future__ import annotations
+
+import argparse
+import contextvars
 import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import GeneratorType
+from typing import TYPE_CHECKING
+
+import cache
+import config
+import fetch
+import scheduler
+import state
+import stats
+
+if TYPE_CHECKING:
+    import nationstates
+
+
+def PoolSize() -> int:
+    """How many connections to the API are kept open: one for each thread which can be fetching at once, in a parallel batch whose
+    commands are each run for every bloc."""
+    return config.fetch_workers * len(config.concurrent_commands) * len(config.blocs)
+
+def GetUserClient(current_user : str | None=None) -> nationstates.Nationstates:
+    # the HTTP libraries are only loaded once a command needs the API, so offline commands start straight away
+    import nationstates
+    import requests
+
+    if current_user is None:
+        current_user = input("Please enter the nation using this script.")
+
+    # the scheduler keeps every request within the rate limit, so the library's own limiter is turned off
+    client = nationstates.Nationstates(f"{current_user} using WA voting bloc tool by Deims Kir (credit dragoe)", ratelimit_enabled=False)
 
+    # connections to the API are kept open and reused, rather than each request setting up its own, and responses are sent compressed
+    session = requests.Session()
+    session.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=PoolSize()))
+    session.headers["Accept-Encoding"] = "gzip"
+    session.hooks["response"] += [stats.RecordResponse, scheduler.Observe]
 
-def GetUserClient() -> nationstates.Nationstates:
-    current_user = input("Please enter the nation using this script.")
-    return nationstates.Nationstates(f"{current_user} using WA voting bloc tool by Deims Kir (credit dragoe)")
+    client.api.use_session = True
+    client.api.session = session
+
+    return client
+
+def LazyClient(current_user : str | None=None):
+    """Returns a function which creates the API client the first time it is called (by a command which uses the API), and returns
+    the same client after that."""
+    client, lock = [], threading.Lock()
+
+    def _GetClient() -> nationstates.Nationstates:
+        with lock:
+            if client == []:
+                client.append(GetUserClient(current_user))
+
+            return client[0]
+
+    return _GetClient
+
+def _UsesAPI(command : str) -> bool:
+    """Whether a line of a batch runs a command which needs the API client."""
+    words = command.strip().lower().split()
+    return words != [] and words[0] in config.commands_list and words[0] not in config.offline_commands
 
 def Canonicalise(string : str) -> str:
     return string.strip().replace(" ", "_").lower()
@@ -24,40 +84,230 @@ def ParseCommand(command : str) -> tuple[str, list, list]:
     
     if any((flag := x) not in config.acceptable_flags[actual_command] for x in flags):
         return -1, f"Invalid flag ('{flag}') provided for command: '{actual_command}'"
+
+    # a flag whose argument can be left out is given an empty one when it is, so the arguments of the flags after it line up
+    argument_flags = [flag for flag in flags if flag not in config.nonargument_flags]
+
+    for index, flag in enumerate(argument_flags):
+        if flag in config.optional_argument_flags and not re.search(rf"{re.escape(flag)}(?![\w-])\s*\[", command):
+            arguments.insert(index, [])
     
     return (actual_command, flags, arguments)
 
-def Main() -> None:
+def _TakeBlocs(command : str) -> tuple[str, list[str] | None]:
+    """Takes "--bloc [names]" out of a command, returning the rest of the command and the names (None if --bloc was not given).
+    As the blocs apply to the whole command, the argument is taken with the flag rather than lined up with the other flags'."""
+    match = re.search(r"--bloc\b\s*(\[[^\]]*\])?", command)
 
-    client = GetUserClient()
+    if match is None:
+        return command, None
 
-    while True:
-        command_selected = input("Enter a command, or enter 'help' to view a list of commands.\n").lower()
-        print()
+    names = [Canonicalise(name) for name in match.group(1)[1:-1].split(",")] if match.group(1) else []
+
+    return command[:match.start()] + command[match.end():], [name for name in dict.fromkeys(names) if name]
+
+def _AsksForInput(command : str, flags : list) -> bool:
+    """Whether a command prompts for input as it runs: with --input, or make_dispatch without any votes given, which asks for each
+    region's vote."""
+    return ("--input" in flags) or (command == "make_dispatch" and not any(flag in flags for flag in ("--for", "--against", "--abstain")))
+
+def _RunForBlocs(command : str, handler, client, flags : list, arguments : list, blocs : list[str]) -> list:
+    """Runs a command once for each bloc, with that bloc's files. The blocs are run at the same time (unless the command prompts
+    for input) and share the command's lookups, so a region in several of their dossiers is only fetched once."""
+
+    def _RunForBloc(bloc : str) -> tuple[bool, str]:
+        with state.Bloc(bloc):
+            return _Output(handler(client, list(flags), [list(argument) for argument in arguments]))
+
+    # each bloc is run in a copy of this thread's context, so its requests are measured as part of the command
+    contexts = [contextvars.copy_context() for _ in blocs]
+
+    if _AsksForInput(command, flags):
+        return [context.run(_RunForBloc, bloc) for context, bloc in zip(contexts, blocs)]
+
+    with ThreadPoolExecutor(max_workers=len(blocs)) as executor:
+        return list(executor.map(lambda context, bloc: context.run(_RunForBloc, bloc), contexts, blocs))
+
+def _Write(chunk : str) -> None:
+    sys.stdout.write(chunk)
+    sys.stdout.flush()
+
+def _Output(result, write=None) -> tuple[bool, str]:
+    """Whether a command's result is a success, and the output to display for it. A command can instead yield its output bit by bit
+    (and return its result at the end), in which case each bit is passed to write as it comes, or is part of the output if there
+    is no write."""
+    if isinstance(result, GeneratorType):
+        streamed, wrote = [], False
+        write = write or streamed.append
+
+        try:
+            while True:
+                write(next(result))
+                wrote = True
+        except StopIteration as stop:
+            succeeded, output = _Output(0 if stop.value is None else stop.value)
+
+        # a failure's message follows whatever was written before it, as does the success message if nothing was
+        return succeeded, "".join(streamed) + ("" if succeeded and wrote else output)
+
+    if isinstance(result, str):
+        return True, result
+    elif result == 0:
+        return True, "Command execution successful"
+
+    return False, f"An error occured: {result[1]}"
+
+def _BeginCommands(flag_lists : list) -> None:
+    """Prepares the shared cache and lookups for one command, or a group of commands run at the same time."""
+    cache.fresh_since = time.time() if any("--fresh" in flags for flags in flag_lists) else None
+    fetch.ClearShared()
+
+def RunCommand(get_client, command : str, begin : bool=True, write=None) -> tuple[bool, str]:
+    """Parses and runs a single command, returning whether it succeeded and the output to display. The API client is only
+    created (by get_client) for commands which use it. With --bloc [names], the command is run for each of the blocs. If write is
+    given, the output of commands which produce it bit by bit is passed to it as it comes, rather than returned."""
+    command_line = command.strip().lower()
+    command_without_blocs, blocs = _TakeBlocs(command_line)
+    parsed_output = ParseCommand(command_without_blocs)
+
+    if parsed_output[0] == -1:
+        return False, parsed_output[1]
+
+    command, flags, arguments = parsed_output
+
+    if blocs is not None:
+        unknown_blocs = [bloc for bloc in blocs if bloc not in config.blocs]
 
-        parsed_output = ParseCommand(command_selected)
+        if "--bloc" not in (config.acceptable_flags[command] or []):
+            return False, f"Invalid flag ('--bloc') provided for command: '{command}'"
+        elif blocs == []:
+            return False, "No blocs were provided"
+        elif unknown_blocs != []:
+            return False, f"Unknown blocs provided: {', '.join(unknown_blocs)}"
 
-        if parsed_output[0] == -1:
-            print(parsed_output[1])
+    if begin:
+        _BeginCommands([flags])
+
+    priority = scheduler.BACKGROUND if command in config.background_commands else scheduler.INTERACTIVE
+
+    with stats.Measure(command_line) as record, scheduler.Priority(priority):
+        client = None if command in config.offline_commands else get_client()
+
+        try:
+            if blocs is None:
+                succeeded, output = _Output(config.GetCommand(command)(client, flags, arguments), write)
+            else:
+                outputs = _RunForBlocs(command, config.GetCommand(command), client, flags, arguments, blocs)
+                succeeded = all(bloc_succeeded for bloc_succeeded, _ in outputs)
+                output = "\n\n".join(f"[{bloc}]\n{bloc_output}" for bloc, (_, bloc_output) in zip(blocs, outputs))
+        except EOFError:
+            # a prompt found its input already closed, as when a script's input is not a terminal
+            succeeded, output = False, "An error occured: the command asked for input, but there was none to read"
+
+        record["succeeded"] = succeeded
+
+    return succeeded, output
+
+def RunBatch(get_client, commands : list[str], concurrent : bool=False) -> int:
+    """Runs a list of commands in order without prompting, stopping at the first one which fails. Blank lines and lines starting
+    with '#' are skipped, and 'exit' stops the batch. If concurrent, consecutive commands listed in config.concurrent_commands
+    are run at the same time. Returns the exit status: 0 if every command succeeded, 1 otherwise."""
+    groups = []
+
+    for command in commands:
+        command = command.strip()
+
+        if command == "" or command.startswith("#"):
             continue
+
+        if command.lower().split()[0] == "exit":
+            break
+
+        parsed_output = ParseCommand(command.lower())
+
+        if parsed_output[0] != -1 and _AsksForInput(parsed_output[0], parsed_output[1]):
+            print(f"'{command}': commands which ask for input (--input, or make_dispatch without --for, --against or --abstain) can not be used in batch mode\n")
+            return 1
+
+        can_share = concurrent and parsed_output[0] in config.concurrent_commands
+
+        if can_share and groups and groups[-1][0]:
+            groups[-1][1].append((command, parsed_output))
         else:
-            command, flags, arguments = parsed_output
-
-        if command != "exit":
-            result = config.commands_list[command](client, flags, arguments)
-
-            if isinstance(result, str):
-                print(result)
-            elif result == 0:
-                print("Command execution successful")
-            elif result[0] == -1:
-                print(f"An error occured: {result[1]}")
-            print()
-            
-            continue
+            groups.append((can_share, [(command, parsed_output)]))
+
+    for _, group in groups:
+        _BeginCommands([parsed_output[1] for _, parsed_output in group if parsed_output[0] != -1])
+
+        # a command run on its own shows its output as it comes; those run at the same time show theirs once they are all done
+        if len(group) == 1:
+            print(f"> {group[0][0]}")
+            results = [RunCommand(get_client, group[0][0], begin=False, write=_Write)]
+            print(f"{results[0][1]}\n" if results[0][1] else "")
+        else:
+            with ThreadPoolExecutor(max_workers=len(group)) as executor:
+                results = list(executor.map(lambda item: RunCommand(get_client, item[0], begin=False), group))
+
+            for (command, _), (succeeded, output) in zip(group, results):
+                print(f"> {command}\n{output}\n")
+
+        if not all(succeeded for succeeded, _ in results):
+            return 1
 
-        return
+    return 0
 
+def Main(current_user : str | None=None) -> None:
+
+    # the nation using the script is asked for when the first command which uses the API is run
+    get_client = LazyClient(current_user)
+
+    while True:
+        try:
+            command_selected = input("Enter a command, or enter 'help' to view a list of commands.\n").lower()
+        except EOFError:
+            return
+
+        print()
+
+        if command_selected.split()[:1] == ["exit"]:
+            return
+
+        _, output = RunCommand(get_client, command_selected, write=_Write)
+
+        if output:
+            print(output)
+
+        print()
+
+def _ParseCommandLine() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="WA bloc management tool. With no arguments, commands are entered interactively.")
+    parser.add_argument("--nation", help="the nation using this script, used in the user agent (required for batch mode if any command uses the API)")
+    parser.add_argument("--command", "-c", action="append", default=[], help="a command to run; may be given several times")
+    parser.add_argument("--script", help="a file of commands to run, one per line ('-' to read them from stdin)")
+    parser.add_argument("--parallel", action="store_true", help="run consecutive commands which do not change the dossier, recommendations or powers at the same time")
+    parser.add_argument("--trace", help="a file to append the measurements of every command and API request to, as JSON lines")
+
+    return parser.parse_args()
 
 if __name__ == "__main__":
-    Main()
+    command_line = _ParseCommandLine()
+
+    if command_line.trace is not None:
+        config.trace_file = command_line.trace
+
+    if not (command_line.command or command_line.script):
+        Main(command_line.nation)
+        sys.exit(0)
+
+    batch_commands = list(command_line.command)
+
+    if command_line.script == "-":
+        batch_commands += sys.stdin.read().splitlines()
+    elif command_line.script is not None:
+        with open(command_line.script, "r") as script_file:
+            batch_commands += script_file.read().splitlines()
+
+    if command_line.nation is None and any(_UsesAPI(command) for command in batch_commands):
+        sys.exit("--nation is required to run commands which use the API without prompting")
+
+    sys.exit(RunBatch(LazyClient(command_line.nation), batch_commands, command_line.parallel))
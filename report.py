@@ -0,0 +1,35 @@
+import csv
+import json
+from contextlib import ExitStack, contextmanager
+
+FORMATS : list[str] = ["csv", "json"]
+
+@contextmanager
+def Export(name : str, columns : list[str], formats : list[str]):
+    """Opens name.csv and/or name.json, and yields a function which writes a row (a tuple in the order of columns) to each of them
+    as it comes, so that no rows are kept in memory. The json file is an array of objects with the columns as keys."""
+    with ExitStack() as stack:
+        writers = []
+
+        if "csv" in formats:
+            csv_writer = csv.writer(stack.enter_context(open(f"{name}.csv", "w", newline="")))
+            csv_writer.writerow(columns)
+            writers.append(csv_writer.writerow)
+
+        if "json" in formats:
+            json_file = stack.enter_context(open(f"{name}.json", "w"))
+            json_file.write("[")
+            written = [False]
+
+            def _WriteJSON(row : tuple) -> None:
+                json_file.write((",\n" if written[0] else "\n") + json.dumps(dict(zip(columns, row))))
+                written[0] = True
+
+            writers.append(_WriteJSON)
+            stack.callback(json_file.write, "\n]\n")
+
+        def _Write(row : tuple) -> None:
+            for write in writers:
+                write(row)
+
+        yield _Write
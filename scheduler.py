@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING
+
+import config
+import stats
+
+if TYPE_CHECKING:
+    import requests
+
+# request priorities; a request only goes ahead when no request of a higher priority (a lower number) is waiting
+INTERACTIVE : int = 0
+BACKGROUND  : int = 1
+
+_priority  : contextvars.ContextVar = contextvars.ContextVar("scheduler_priority", default=INTERACTIVE)
+_condition : threading.Condition    = threading.Condition()
+_waiting   : dict[int, int]         = {INTERACTIVE : 0, BACKGROUND : 0}
+
+# the token bucket, shared by every request the process makes. Until the server's rate limit headers are seen, config.py's limit is used
+_tokens        : float        = 0.0
+_last_refill   : float | None = None
+_limit         : int | None   = None
+_window        : float | None = None
+_rate_factor   : float        = 1.0
+_blocked_until : float        = 0.0
+
+def _Limit() -> tuple[int, float]:
+    """The number of requests per window to stay within, and the window in seconds."""
+    if _limit is None:
+        return config.ratelimit_requests, config.ratelimit_window
+
+    return _limit - config.ratelimit_margin, _window
+
+def _Burst() -> int:
+    return min(config.ratelimit_burst, _Limit()[0])
+
+def _Rate() -> float:
+    """Tokens added per second. As a full bucket can be spent at once, the rest of the limit is spread over the window, so that no
+    window ever holds more than the limit."""
+    limit, window = _Limit()
+    return max(1, limit - _Burst()) / window * _rate_factor
+
+def _Refill(now : float) -> None:
+    global _tokens, _last_refill
+
+    if _last_refill is None:
+        _tokens = _Burst()
+    else:
+        _tokens = min(_Burst(), _tokens + (now - _last_refill) * _Rate())
+
+    _last_refill = now
+
+@contextmanager
+def Priority(priority : int):
+    """Runs the requests made inside it (including by fetch.FetchAll's threads) at the given priority."""
+    token = _priority.set(priority)
+
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+def Acquire() -> None:
+    """Blocks until a request can be sent without breaking the rate limit, letting higher priority requests go first."""
+    global _tokens
+
+    priority = _priority.get()
+    start_time = time.perf_counter()
+
+    with _condition:
+        _waiting[priority] += 1
+
+        try:
+            while True:
+                now = time.monotonic()
+                _Refill(now)
+                higher_waiting = any(count for waiting_priority, count in _waiting.items() if waiting_priority < priority)
+
+                if now >= _blocked_until and _tokens >= 1 and not higher_waiting:
+                    _tokens -= 1
+                    break
+
+                if now < _blocked_until:
+                    wait_time = _blocked_until - now
+                elif _tokens < 1:
+                    wait_time = (1 - _tokens) / _Rate()
+                else:
+                    wait_time = None
+
+                _condition.wait(wait_time)
+        finally:
+            _waiting[priority] -= 1
+            _condition.notify_all()
+
+    stats.RecordTime("throttled", time.perf_counter() - start_time)
+
+def _HeaderNumber(headers, *names : str) -> float | None:
+    for name in names:
+        try:
+            return float(headers[name])
+        except (KeyError, ValueError):
+            continue
+
+    return None
+
+def _ParsePolicy(policy : str) -> tuple[float | None, float | None]:
+    """Reads the limit and window from a RateLimit-Policy header, which is in the form "50;w=30"."""
+    limit, window = None, None
+
+    for index, part in enumerate(policy.split(";")):
+        part = part.strip()
+
+        try:
+            if index == 0 and part:
+                limit = float(part)
+            elif part.startswith("w="):
+                window = float(part[2:])
+        except ValueError:
+            continue
+
+    return limit, window
+
+def Observe(response : requests.Response, *args, **kwargs) -> None:
+    """Tunes the bucket from the rate limit headers of a response, and backs off after a 429."""
+    global _tokens, _limit, _window, _rate_factor, _blocked_until
+
+    headers = response.headers
+
+    with _condition:
+        now = time.monotonic()
+        _Refill(now)
+
+        policy_limit, policy_window = _ParsePolicy(headers.get("RateLimit-Policy", ""))
+        limit = _HeaderNumber(headers, "RateLimit-Limit") or policy_limit
+
+        if limit is not None:
+            _limit = int(limit)
+            _window = policy_window or _window or config.ratelimit_window
+
+        remaining = _HeaderNumber(headers, "RateLimit-Remaining")
+        seen = _HeaderNumber(headers, "X-ratelimit-requests-seen")
+
+        if remaining is None and seen is not None and _limit is not None:
+            remaining = _limit - seen
+
+        if response.status_code == 429:
+            # wait as long as the server asks, and slow down for a while afterwards
+            retry_after = _HeaderNumber(headers, "Retry-After", "X-Retry-After") or _Limit()[1]
+            _blocked_until = max(_blocked_until, now + retry_after)
+            _rate_factor = max(config.ratelimit_min_factor, _rate_factor / 2)
+            _tokens = 0.0
+        else:
+            _rate_factor = min(1.0, _rate_factor + 1 / _Limit()[0])
+
+            if remaining is not None:
+                # requests from elsewhere (other tools on the same IP) use up the server's limit too
+                _tokens = min(_tokens, max(0.0, remaining - config.ratelimit_margin))
+
+                if remaining <= config.ratelimit_margin:
+                    reset = _HeaderNumber(headers, "RateLimit-Reset") or _Limit()[1]
+                    _blocked_until = max(_blocked_until, now + reset)
+
+        _condition.notify_all()
@@ -0,0 +1,151 @@
+import contextvars
+import csv
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import config
+import stats
+
+DEFAULT_BLOC : str = "default"
+
+# path -> (modification time when loaded, parsed contents)
+_loaded : dict[str, tuple] = {}
+_lock   : threading.RLock  = threading.RLock()
+
+# the bloc whose files are used by the commands run in Bloc (and by the threads they start)
+_bloc : contextvars.ContextVar = contextvars.ContextVar("state_bloc", default=DEFAULT_BLOC)
+
+@contextmanager
+def Bloc(name : str):
+    """Uses the files of the given bloc (from config.blocs) inside it."""
+    token = _bloc.set(name)
+
+    try:
+        yield
+    finally:
+        _bloc.reset(token)
+
+def Path(setting : str) -> str:
+    """The file named by a setting of config.py (such as "region_file") for the current bloc."""
+    return config.blocs.get(_bloc.get(), {}).get(setting, getattr(config, setting))
+
+def OutputName(file_name : str) -> str:
+    """Prefixes the name of a report or dispatch with the current bloc, unless it is the default one, so that blocs do not write over
+    each other's."""
+    return file_name if _bloc.get() == DEFAULT_BLOC else f"{_bloc.get()}_{file_name}"
+
+def _ReadRows(path : str) -> list[list[str]]:
+    try:
+        with open(path, "r", newline="") as file:
+            return [row for row in csv.reader(file, delimiter=",")]
+    except FileNotFoundError:
+        return []
+
+def _ModifiedTime(path : str) -> int | None:
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+def _Load(path : str, parser):
+    """Returns the parsed contents of a file, only reading it again if it has changed on disk since it was last loaded."""
+    with _lock:
+        modified_time = _ModifiedTime(path)
+        loaded = _loaded.get(path)
+
+        if loaded is None or loaded[0] != modified_time:
+            start_time = time.perf_counter()
+            loaded = (modified_time, parser(_ReadRows(path)))
+            _loaded[path] = loaded
+            stats.RecordTime("io", time.perf_counter() - start_time)
+
+        return loaded[1]
+
+def _WriteRows(path : str, rows : list, parsed) -> None:
+    """Atomically replaces a file with the given rows, and keeps the parsed contents so the file is not read again."""
+    with _lock:
+        start_time = time.perf_counter()
+        directory = os.path.dirname(os.path.abspath(path))
+        file_descriptor, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+
+        try:
+            with os.fdopen(file_descriptor, "w", newline="") as file:
+                csv.writer(file, delimiter=",").writerows(rows)
+
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+        _loaded[path] = (_ModifiedTime(path), parsed)
+        stats.RecordTime("io", time.perf_counter() - start_time)
+
+def _ParseDossier(rows : list) -> tuple[list[str], set[str]]:
+    regions = list(dict.fromkeys(region for row in rows for region in row if region))
+    return regions, set(regions)
+
+def _ParseRecommendations(rows : list) -> dict[str, str]:
+    return {row[0] : row[1] for row in rows}
+
+def _ParsePower(rows : list) -> tuple[dict[str, list], list]:
+    parsed_rows = [[row[0]] + [int(value) for value in row[1:]] for row in rows]
+
+    if parsed_rows == []:
+        return {}, ["TOTAL", 0, 0, 0]
+
+    return {row[0] : row for row in parsed_rows[:-1]}, parsed_rows[-1]
+
+def Dossier() -> list[str]:
+    """The regions in the dossier, in order. This must not be modified; use AddToDossier and RemoveFromDossier."""
+    return _Load(Path("region_file"), _ParseDossier)[0]
+
+def InDossier(region : str) -> bool:
+    return region in _Load(Path("region_file"), _ParseDossier)[1]
+
+def AddToDossier(regions : list) -> list[str]:
+    """Adds the regions not already in the dossier, and returns those which were added."""
+    with _lock:
+        dossier, dossier_set = _Load(Path("region_file"), _ParseDossier)
+        added = [region for region in dict.fromkeys(regions) if region not in dossier_set]
+
+        if added != []:
+            _WriteDossier(dossier + added)
+
+        return added
+
+def RemoveFromDossier(regions : list) -> list[str]:
+    """Removes the given regions from the dossier, and returns those which were removed."""
+    with _lock:
+        dossier, dossier_set = _Load(Path("region_file"), _ParseDossier)
+        to_remove = set(regions) & dossier_set
+
+        if to_remove:
+            _WriteDossier([region for region in dossier if region not in to_remove])
+
+        return [region for region in dict.fromkeys(regions) if region in to_remove]
+
+def _WriteDossier(regions : list) -> None:
+    _WriteRows(Path("region_file"), [regions] if regions else [], (regions, set(regions)))
+
+def Recommendations() -> dict[str, str]:
+    """The current recommendations, in the format "GA" : "FOR". This must not be modified; use SetRecommendations."""
+    return _Load(Path("recommendations_file"), _ParseRecommendations)
+
+def SetRecommendations(recommendations : dict) -> None:
+    recommendations = {chamber : recommendations.get(chamber) for chamber in ("GA", "SC")}
+    _WriteRows(Path("recommendations_file"), [[chamber, rec] for chamber, rec in recommendations.items()], recommendations)
+
+def PowerRows() -> dict[str, list]:
+    """The rows of the power table ([region, delegate votes, WA nations, power, last refreshed]) keyed by region, without the
+    TOTAL row. This must not be modified; use WritePower."""
+    return _Load(Path("votepower_file"), _ParsePower)[0]
+
+def PowerTotal() -> list:
+    """The TOTAL row of the power table."""
+    return _Load(Path("votepower_file"), _ParsePower)[1]
+
+def WritePower(rows : list, total_row : list) -> None:
+    _WriteRows(Path("votepower_file"), rows + [total_row], ({row[0] : row for row in rows}, total_row))
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import contextvars
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING
+
+import config
+
+if TYPE_CHECKING:
+    import requests
+
+# the measurements of the command being run by the current thread (or the thread which started it), or None
+_current : contextvars.ContextVar = contextvars.ContextVar("stats_current", default=None)
+_lock    : threading.Lock          = threading.Lock()
+
+# the measurements of the most recent commands, oldest first
+records : list[dict] = []
+
+def _Trace(event : dict) -> None:
+    if config.trace_file is None:
+        return
+
+    with _lock:
+        with open(config.trace_file, "a") as trace_file:
+            trace_file.write(json.dumps(event) + "\n")
+
+@contextmanager
+def Measure(command : str):
+    """Measures everything done while running command (including by fetch.FetchAll's threads), and keeps it in records."""
+    record = {"command" : command, "started" : time.time(), "wall" : 0.0, "requests" : 0, "bytes" : 0, "network" : 0.0, "throttled" : 0.0, "io" : 0.0, "succeeded" : False}
+    token = _current.set(record)
+    start_time = time.perf_counter()
+
+    try:
+        yield record
+    finally:
+        record["wall"] = time.perf_counter() - start_time
+        _current.reset(token)
+
+        with _lock:
+            records.append(record)
+            del records[:-config.stats_history]
+
+        _Trace({"type" : "command"} | record)
+
+def RecordTime(category : str, seconds : float) -> None:
+    """Adds time spent on "network", "throttled" (waiting for the rate limit) or "io" (reading and writing files) to the current command."""
+    record = _current.get()
+
+    if record is not None:
+        with _lock:
+            record[category] += seconds
+
+def RecordResponse(response : requests.Response, *args, **kwargs) -> None:
+    """A response hook for the client's session, which records every request made by client.region, client.nation or client.wa."""
+    start_time = time.perf_counter()
+
+    # the body is read first, so that its whole size as it came over the network (compressed) is known
+    content_size = len(response.content)
+    size = response.raw.tell() if hasattr(response.raw, "tell") else content_size
+    seconds = response.elapsed.total_seconds() + time.perf_counter() - start_time
+    record = _current.get()
+
+    if record is not None:
+        with _lock:
+            record["requests"] += 1
+            record["bytes"] += size
+            record["network"] += seconds
+
+    _Trace({"type" : "request", "command" : record["command"] if record else None, "url" : response.url, "status" : response.status_code, "bytes" : size, "seconds" : seconds})
+
+def Clear() -> None:
+    with _lock:
+        records.clear()
@@ -0,0 +1,65 @@
+from typing import Callable
+
+def Threshold(succeeds : Callable[[int], bool], limit : int) -> int | None:
+    """Returns the least extra power, up to limit, for which succeeds is true, or None if even limit is not enough. succeeds must
+    never go from true back to false as the power grows."""
+    if not succeeds(limit):
+        return None
+
+    low, high = 0, limit
+
+    while low < high:
+        middle = (low + high) // 2
+
+        if succeeds(middle):
+            high = middle
+        else:
+            low = middle + 1
+
+    return low
+
+def FewestRegions(regions : list[tuple[str, int]], needed : int) -> list[tuple[str, int]] | None:
+    """Returns the fewest (region, power) whose power adds up to at least needed, or None if all of them together fall short. Taking
+    the most powerful regions first always uses the fewest."""
+    chosen, power = [], 0
+
+    for region in sorted(regions, key=lambda region: region[1], reverse=True):
+        if power >= needed:
+            break
+
+        chosen.append(region)
+        power += region[1]
+
+    return chosen if power >= needed else None
+
+def LeastPower(regions : list[tuple[str, int]], needed : int) -> list[tuple[str, int]] | None:
+    """Returns the (region, power) whose power adds up to the least total which is still at least needed, or None if all of them
+    together fall short. This is a subset sum over the (integer) powers, with the sums reachable by each prefix of the regions held
+    as the bits of an int, so each region is added with one shift and or."""
+    regions = [region for region in regions if region[1] > 0]
+
+    if needed <= 0:
+        return []
+
+    if sum(power for _, power in regions) < needed:
+        return None
+
+    # no region can be dropped from the best set without falling short, so its total is less than needed plus its largest power
+    mask = (1 << (needed + max(power for _, power in regions))) - 1
+    reachable = [1]
+
+    for _, power in regions:
+        reachable.append((reachable[-1] | (reachable[-1] << power)) & mask)
+
+    enough = reachable[-1] >> needed
+    total = needed + (enough & -enough).bit_length() - 1
+
+    # walk back through the prefixes: a region is in the set if the total could not be reached without it
+    chosen = []
+
+    for index in range(len(regions), 0, -1):
+        if not (reachable[index - 1] >> total) & 1:
+            chosen.append(regions[index - 1])
+            total -= regions[index - 1][1]
+
+    return chosen[::-1]
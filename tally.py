@@ -0,0 +1,52 @@
+import numpy as np
+
+# how each region voted on each resolution in a vote matrix. Regions which were not in the bloc for a resolution are ABSENT, and
+# count towards nothing, not even the total power
+ABSENT  : int = -1
+NONE    : int = 0
+FOR     : int = 1
+AGAINST : int = 2
+ABSTAIN : int = 3
+
+VOTE_CODES : dict[str, int] = {"NONE" : NONE, "FOR" : FOR, "AGAINST" : AGAINST, "ABSTAIN" : ABSTAIN}
+
+# python's round, which rounds the exact value of each float, rather than numpy's, which rounds it after scaling it by 100
+_round = np.frompyfunc(round, 2, 1)
+
+def VoteMatrix(regions : list[str], columns : list, votes : list[tuple]) -> np.ndarray:
+    """Builds a regions x resolutions matrix of vote codes from (column, region, vote) rows, where each column is one of columns
+    and each vote is one of VOTE_CODES. Regions with no row for a column are ABSENT from it."""
+    region_index = {region : index for index, region in enumerate(regions)}
+    column_index = {column : index for index, column in enumerate(columns)}
+    matrix = np.full((len(regions), len(columns)), ABSENT, dtype=np.int8)
+
+    for column, region, vote in votes:
+        matrix[region_index[region], column_index[column]] = VOTE_CODES[vote]
+
+    return matrix
+
+def Tally(votes : np.ndarray, powers : np.ndarray, totals : np.ndarray | None=None) -> dict[str, np.ndarray]:
+    """Tallies every resolution of a regions x resolutions vote matrix at once, for one power table (a vector with the power of
+    each region) or several (a tables x regions array). The totals are the power each percentage is of, by default the power of
+    the regions which are not ABSENT. The results are arrays over resolutions (tables x resolutions for several tables):
+    "power" and "percent" (each 4 deep, in the order FOR, AGAINST, ABSTAIN, NONE), "recommendation" and "binding". They match
+    calc_vote's tally of each resolution exactly."""
+    votes, powers = np.asarray(votes), np.asarray(powers, dtype=np.int64)
+
+    # the power of each side of every resolution (for every table) is one matrix product with a 0/1 matrix of who voted for it
+    side_powers = np.stack([powers @ (votes == code).astype(np.int64) for code in (FOR, AGAINST, ABSTAIN, NONE)], axis=-2)
+
+    if totals is None:
+        totals = side_powers.sum(axis=-2)
+
+    # the same operations as calc_vote, in float64, so each percentage rounds the same way
+    percents = _round(side_powers / np.expand_dims(totals, -2) * 100, 2).astype(np.float64)
+    for_percent, against_percent, abstain_percent = percents[..., 0, :], percents[..., 1, :], percents[..., 2, :]
+
+    carries_for = for_percent > np.maximum(against_percent, abstain_percent)
+    carries_against = ~carries_for & (against_percent > abstain_percent)
+
+    recommendation = np.where(carries_for, "FOR", np.where(carries_against, "AGAINST", "NO RECOMMENDATION"))
+    max_percent = np.where(carries_for, for_percent, np.where(carries_against, against_percent, abstain_percent))
+
+    return {"power" : side_powers, "percent" : percents, "recommendation" : recommendation, "binding" : max_percent > 50}
@@ -0,0 +1,106 @@
+import os
+import re
+import threading
+
+# dispatch template tags:
+# $name -> proposal name
+# $auth -> author
+# $con  -> content of the proposal, author, coauthor
+# $typ  -> type of the proposal (ga/sc)
+# $for  -> forum link
+# $rec  -> recommendation
+# $aye  -> aye % (weighted)
+# $avt  -> regions voting aye
+# $nay  -> nay % (weighted)
+# $nvt  -> regions voting nay
+# $abs  -> abstentions
+# $abvt -> regions abstaining
+# $tof  -> turnout as a fraction
+# $tow  -> turnout % (weighted)
+TAGS : set[str] = {"name", "auth", "con", "typ", "for", "rec", "aye", "avt", "nay", "nvt", "abs", "abvt", "tof", "tow"}
+
+# the vote totals which are made bold when they match the recommendation
+_EMPHASISED : dict[str, str] = {"aye" : "FOR", "nay" : "AGAINST", "abs" : "NO RECOMMENDATION"}
+
+_TOKEN_PATTERN = re.compile(r"(?P<emphasis>(?P<label>AYES|NAYS|ABSTENTIONS): \$(?P<total>aye|nay|abs)%)|(?P<vote_rec>vote \[/color\]\$rec)|\$(?P<tag>[a-z]+)")
+
+# path -> (modification time when compiled, tokens)
+_compiled : dict[str, tuple] = {}
+_lock     : threading.Lock   = threading.Lock()
+
+def Compile(contents : str) -> list[tuple]:
+    """Splits a template into a list of tokens: ("text", text), ("tag", tag), ("emphasis", (label, tag)) for a vote total which
+    is made bold when it matches the recommendation, and ("vote_rec", None) for the recommendation after 'vote'.
+    Raises a ValueError if the template uses any unknown tags."""
+    tokens, position = [], 0
+    unknown_tags = []
+
+    for match in _TOKEN_PATTERN.finditer(contents):
+        if match.start() > position:
+            tokens.append(("text", contents[position:match.start()]))
+
+        if match["emphasis"]:
+            tokens.append(("emphasis", (match["label"], match["total"])))
+        elif match["vote_rec"]:
+            tokens.append(("vote_rec", None))
+        elif match["tag"] in TAGS:
+            tokens.append(("tag", match["tag"]))
+        else:
+            unknown_tags.append(f"${match['tag']}")
+
+        position = match.end()
+
+    if unknown_tags != []:
+        raise ValueError(f"Unknown tags in the dispatch template: {', '.join(dict.fromkeys(unknown_tags))}")
+
+    if position < len(contents):
+        tokens.append(("text", contents[position:]))
+
+    return tokens
+
+def Load(path : str) -> list[tuple]:
+    """Returns the compiled tokens of a template file, only reading and compiling it again if it has changed on disk."""
+    with _lock:
+        modified_time = os.stat(path).st_mtime_ns
+        compiled = _compiled.get(path)
+
+        if compiled is None or compiled[0] != modified_time:
+            with open(path, "r") as template_file:
+                compiled = (modified_time, Compile(template_file.read()))
+
+            _compiled[path] = compiled
+
+        return compiled[1]
+
+def _RecommendationText(consensus : str) -> str:
+    match consensus:
+        case "FOR":
+            return "[color=#2fc657][u]FOR[/u][/color]"
+        case "AGAINST":
+            return "[color=#ea4335][u]AGAINST[/u][/color]"
+        case _:
+            return "[u]ABSTAIN ON[/u]"
+
+def Render(tokens : list[tuple], values : dict[str, str], consensus : str) -> str:
+    """Renders compiled template tokens in a single pass, using values for each tag (other than $rec) and the consensus."""
+    parts = []
+
+    for kind, value in tokens:
+        match kind:
+            case "text":
+                parts.append(value)
+            case "tag":
+                parts.append(_RecommendationText(consensus) if value == "rec" else values[value])
+            case "emphasis":
+                label, total = value
+                text = f"{label}: {values[total]}%"
+                parts.append(f"[b]{text}[/b]" if consensus == _EMPHASISED[total] else text)
+            case "vote_rec":
+                parts.append("[/color] [u]ABSTAIN ON[/u]" if consensus == "NO RECOMMENDATION" else f"vote [/color]{_RecommendationText(consensus)}")
+
+    return "".join(parts)
+
+def RenderAll(paths : list[str], values_list : list[dict], consensus : str) -> list[str]:
+    """Renders every template in paths with every set of values in values_list (for example, the same vote with a GA and an SC
+    resolution), loading each template only once. The dispatches are returned in order of template, then values."""
+    return [Render(Load(path), values, consensus) for path in paths for values in values_list]
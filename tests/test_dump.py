@@ -0,0 +1,46 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dump
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+def _ReadFixture(regions : list) -> list:
+    return dump.ReadRegionPower(os.path.join(FIXTURES, "regions.xml.gz"), os.path.join(FIXTURES, "nations.xml.gz"), regions)
+
+class ReadRegionPowerTest(unittest.TestCase):
+
+    def test_counts_wa_members_and_delegates_only(self):
+        region, result, error = _ReadFixture(["ridge_field"])[0]
+
+        self.assertIsNone(error)
+        self.assertEqual(result, {"region" : "ridge_field", "delegatevotes" : 4, "numwanations" : 2})
+
+    def test_canonicalises_region_names(self):
+        # "Ridge Field" and "The North" in the dumps are matched to the dossier's "ridge_field" and "the_north"
+        results = {region : result for region, result, _ in _ReadFixture(["the_north", "ridge_field"])}
+
+        self.assertEqual(results["the_north"]["numwanations"], 1)
+        self.assertEqual(results["ridge_field"]["numwanations"], 2)
+
+    def test_missing_region(self):
+        self.assertEqual(_ReadFixture(["atlantis"]), [("atlantis", None, "region not found in the dump")])
+
+    def test_results_follow_the_order_of_regions(self):
+        results = _ReadFixture(["the_north", "atlantis", "ridge_field"])
+
+        self.assertEqual([region for region, _, _ in results], ["the_north", "atlantis", "ridge_field"])
+        self.assertEqual([error is None for _, _, error in results], [True, False, True])
+
+    def test_ignores_regions_outside_the_dossier(self):
+        self.assertNotIn("unwatched_region", [region for region, _, _ in _ReadFixture(["ridge_field"])])
+
+    def test_missing_dump_file(self):
+        with self.assertRaises(FileNotFoundError):
+            dump.ReadRegionPower(os.path.join(FIXTURES, "missing.xml.gz"), os.path.join(FIXTURES, "nations.xml.gz"), ["ridge_field"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import itertools
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import swing
+
+def _BruteForce(regions : list, needed : int) -> tuple[int | None, int | None]:
+    """The least total power, and the fewest regions, of any set of the regions with at least needed power."""
+    least_power, fewest = None, None
+
+    for count in range(len(regions) + 1):
+        for chosen in itertools.combinations(regions, count):
+            power = sum(power for _, power in chosen)
+
+            if power >= needed:
+                least_power = power if least_power is None else min(least_power, power)
+                fewest = count if fewest is None else min(fewest, count)
+
+    return least_power, fewest
+
+class SwingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.random = random.Random(16)
+
+    def _RandomCases(self, count : int):
+        for _ in range(count):
+            regions = [(f"region_{index}", self.random.randint(0, 60)) for index in range(self.random.randint(0, 10))]
+            yield regions, self.random.randint(-2, 300)
+
+    def test_least_power_matches_brute_force(self):
+        for regions, needed in self._RandomCases(500):
+            least_power, _ = _BruteForce(regions, needed)
+            chosen = swing.LeastPower(regions, needed)
+
+            if least_power is None:
+                self.assertIsNone(chosen, (regions, needed))
+                continue
+
+            self.assertEqual(sum(power for _, power in chosen), least_power, (regions, needed))
+            self.assertEqual(len(set(chosen)), len(chosen))
+            self.assertTrue(set(chosen) <= set(regions))
+
+    def test_fewest_regions_matches_brute_force(self):
+        for regions, needed in self._RandomCases(500):
+            _, fewest = _BruteForce(regions, needed)
+            chosen = swing.FewestRegions(regions, needed)
+
+            if fewest is None:
+                self.assertIsNone(chosen, (regions, needed))
+                continue
+
+            self.assertEqual(len(chosen), fewest, (regions, needed))
+            self.assertGreaterEqual(sum(power for _, power in chosen), needed)
+
+    def test_threshold(self):
+        for limit in range(0, 50):
+            for answer in range(0, 55):
+                expected = answer if answer <= limit else None
+                self.assertEqual(swing.Threshold(lambda extra: extra >= answer, limit), expected)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import commands
+
+try:
+    import numpy as np
+    import tally
+except ImportError:
+    np = None
+
+def _CalcVote(votes : list[int], powers : list[int]) -> tuple[str, list[float], bool]:
+    """Tallies one resolution the way calc_vote does: the recommendation, the (for, against, abstain, non-voting) percentages and
+    whether it binds."""
+    side_powers = [sum(power for vote, power in zip(votes, powers) if vote == code) for code in (tally.FOR, tally.AGAINST, tally.ABSTAIN, tally.NONE)]
+    total_power = sum(side_powers)
+    percents = [commands._CalcVotePercent(power, total_power) for power in side_powers]
+    recommendation, max_percent = commands._Recommendation(*percents[:3])
+
+    return recommendation, percents, max_percent > 50
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class TallyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.random = random.Random(17)
+
+    def _Check(self, matrix, tables : list[list[int]]) -> None:
+        results = tally.Tally(matrix, np.array(tables))
+
+        for table_index, powers in enumerate(tables):
+            for column in range(matrix.shape[1]):
+                recommendation, percents, binding = _CalcVote(matrix[:, column].tolist(), powers)
+
+                self.assertEqual(results["recommendation"][table_index, column], recommendation)
+                self.assertEqual(results["percent"][table_index, :, column].tolist(), percents)
+                self.assertEqual(bool(results["binding"][table_index, column]), binding)
+
+    def test_matches_calc_vote(self):
+        for _ in range(50):
+            regions = self.random.randint(1, 30)
+            matrix = np.array([[self.random.randint(tally.ABSENT, tally.ABSTAIN) for _ in range(20)] for _ in range(regions)], dtype=np.int8)
+
+            # every resolution needs at least one region in it, or there is no power to take percentages of
+            matrix[0][matrix[0] == tally.ABSENT] = tally.NONE
+
+            self._Check(matrix, [[self.random.randint(1, 500) for _ in range(regions)] for _ in range(3)])
+
+    def test_ties(self):
+        # equal powers on each side, which calc_vote breaks towards AGAINST over ABSTAIN, and no recommendation over FOR
+        matrix = np.array([[tally.FOR, tally.FOR, tally.AGAINST], [tally.AGAINST, tally.ABSTAIN, tally.ABSTAIN], [tally.NONE, tally.NONE, tally.NONE]], dtype=np.int8)
+        self._Check(matrix, [[10, 10, 5], [1, 1, 1]])
+
+    def test_no_votes(self):
+        matrix = np.full((5, 4), tally.NONE, dtype=np.int8)
+        self._Check(matrix, [[self.random.randint(1, 100) for _ in range(5)]])
+
+    def test_one_table(self):
+        matrix = np.array([[tally.FOR], [tally.AGAINST], [tally.ABSENT]], dtype=np.int8)
+        results = tally.Tally(matrix, [60, 40, 1000])
+
+        self.assertEqual(results["recommendation"].tolist(), ["FOR"])
+        self.assertEqual(results["percent"][:, 0].tolist(), [60.0, 40.0, 0.0, 0.0])
+        self.assertEqual(results["binding"].tolist(), [True])
+
+if __name__ == "__main__":
+    unittest.main()